@@ -57,7 +57,7 @@ class ElevatorApi:
 
     def move_to_floor(self, floor: int) -> None:
         """ This method is best written as an async method with a requests queue
-        But we'll ignore that for the sake of brevity
+        But we'll ignore that for the sake of brevity (see command_async.py for that version)
         """
         print('Moving to floor', floor)
         if self.on_floor():
@@ -0,0 +1,103 @@
+""" The elevator of command.py blocks on every floor button: ElevatorApi.move_to_floor
+sleeps until the car arrives, so nobody can press another button, open the doors or
+call the emergency center in the meantime.
+
+Replace the receiver with an asyncio one. The commands, the buttons and the Elevator
+application stay the same:
+- move_to_floor only puts the floor in a requests queue and returns immediately
+- a worker task serves the queue in order, every move runs as its own task
+- the door and emergency commands keep executing right away, even during a move
+"""
+
+import asyncio
+import time
+import typing as t
+
+from command import Elevator, ElevatorApi, ElevatorState, EmergencyCenter
+
+
+class AsyncElevatorApi(ElevatorApi):
+    def __init__(self, doors_time: float = 2, travel_time: float = 3, floor_time: float = 0) -> None:
+        super().__init__()
+        self.doors_time = doors_time
+        # A move takes travel_time, plus floor_time for every floor on the way
+        self.travel_time = travel_time
+        self.floor_time = floor_time
+        self.requests: asyncio.Queue = asyncio.Queue()
+        self.current_move: t.Optional[asyncio.Task] = None
+        self._worker: t.Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._worker = asyncio.create_task(self._serve_requests())
+
+    async def stop(self) -> None:
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    async def wait_idle(self) -> None:
+        """ Wait until every requested floor was served. """
+        await self.requests.join()
+
+    def move_to_floor(self, floor: int) -> None:
+        self.requests.put_nowait(floor)
+
+    async def _serve_requests(self) -> None:
+        while True:
+            floor = await self.requests.get()
+            try:
+                if floor != self.current_floor:
+                    self.current_move = asyncio.create_task(self._move(floor))
+                    await self.current_move
+            finally:
+                self.current_move = None
+                self.requests.task_done()
+
+    async def _move(self, floor: int) -> None:
+        print('Moving to floor', floor)
+        if self.on_floor():
+            print('     Closing the doors')
+            await asyncio.sleep(self.doors_time)
+            self.close_doors()
+
+        self.state = ElevatorState.RUNNING
+        print('     Elevator running')
+        await asyncio.sleep(self.travel_time + self.floor_time * abs(floor - self.current_floor))
+        self.state = ElevatorState.IDLE
+        self.current_floor = floor
+        self.open_doors()
+        print('     Arrived at destination')
+
+
+async def main() -> None:
+    elevator_api = AsyncElevatorApi(doors_time=0.2, travel_time=0.3)
+    emergency_center = EmergencyCenter()
+    elevator = Elevator(
+        max_floors=9,
+        elevator_api=elevator_api,
+        emergency_center=emergency_center)
+    elevator.create_board()
+    elevator_api.start()
+
+    start = time.perf_counter()
+    elevator.select('4')
+    elevator.select('9')
+    print(f'Two floors requested in {(time.perf_counter() - start) * 1000:.2f}ms')
+
+    await asyncio.sleep(0.3)
+    # The doors stay closed while running, but the buttons answer right away
+    elevator.select('door_open')
+    print('Door state while running', elevator_api.doors)
+    elevator.select('emergency')
+    print('Lights', elevator_api.lights_intensity)
+
+    await elevator_api.wait_idle()
+    print(f'Floor {elevator_api.current_floor} reached after {time.perf_counter() - start:.2f}s')
+    print('Door state', elevator_api.doors)
+    await elevator_api.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
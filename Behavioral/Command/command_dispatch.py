@@ -0,0 +1,252 @@
+""" Large buildings have many elevator cars, but the Elevator application drives a single
+ElevatorApi and serves the floors strictly in the order the buttons were pressed.
+
+Add a dispatcher in front of the cars:
+- the floor requests are the usual NumberButtonCommand objects, they are collected
+  and assigned all at once, every time the dispatcher runs
+- the dispatch policy is pluggable: it picks the car for every request and orders
+  the stops of every car
+- NearestCarPolicy sends a request to the closest car and keeps the press order,
+  LookPolicy sweeps in one direction while there are stops ahead and then turns,
+  ScanPolicy sweeps up to the last floor of the building before turning
+- the chosen car is driven with a NumberButtonCommand bound to its own ElevatorApi
+"""
+
+import abc
+import asyncio
+import random
+import typing as t
+
+from command import ElevatorApi, EmergencyCenter, NumberButtonCommand
+
+
+class Car:
+    """ The dispatcher's view of one car: its receiver and its planned stops. """
+
+    def __init__(self, name: str, elevator_api: ElevatorApi):
+        self.name = name
+        self.elevator_api = elevator_api
+        self.stops: t.List[int] = []
+        self.target: t.Optional[int] = None  # the stop the car is serving
+        self.direction = 0  # 1 going up, -1 going down, 0 idle
+        self.wakeup = asyncio.Event()
+
+    @property
+    def floor(self) -> int:
+        return self.elevator_api.current_floor
+
+    def __repr__(self) -> str:
+        return f'Car({self.name}, floor={self.floor}, stops={self.stops})'
+
+
+def route_length(start: int, stops: t.Sequence[int], until: t.Optional[int] = None) -> int:
+    """ Floors travelled from start through the stops, or up to the first visit of `until`. """
+    length = 0
+    for stop in stops:
+        length += abs(stop - start)
+        start = stop
+        if stop == until:
+            break
+
+    return length
+
+
+class DispatchPolicy(abc.ABC):
+    def __init__(self, top_floor: int):
+        self.top_floor = top_floor
+
+    @abc.abstractmethod
+    def order_stops(self, car: Car, stops: t.Iterable[int]) -> t.List[int]:
+        pass
+
+    def choose_car(self, cars: t.Sequence[Car], floor: int) -> Car:
+        """ The car that reaches the floor first once it is added to its stops,
+        then the one with the shortest route overall.
+        """
+        def cost(car: Car) -> t.Tuple[int, int]:
+            stops = self.order_stops(car, car.stops + [floor])
+            return route_length(car.floor, stops, until=floor), route_length(car.floor, stops)
+
+        return min(cars, key=cost)
+
+
+class NearestCarPolicy(DispatchPolicy):
+    def order_stops(self, car: Car, stops: t.Iterable[int]) -> t.List[int]:
+        # Press order, without the floors that are already planned
+        return list(dict.fromkeys(stops))
+
+    def choose_car(self, cars: t.Sequence[Car], floor: int) -> Car:
+        return min(cars, key=lambda car: abs(car.floor - floor))
+
+
+class LookPolicy(DispatchPolicy):
+    def order_stops(self, car: Car, stops: t.Iterable[int]) -> t.List[int]:
+        stops = set(stops)
+        above = sorted(stop for stop in stops if stop > car.floor)
+        below = sorted((stop for stop in stops if stop < car.floor), reverse=True)
+
+        direction = car.direction
+        if not direction:
+            # An idle car starts towards its nearest stop
+            nearest = min(stops, key=lambda stop: abs(stop - car.floor), default=car.floor)
+            direction = 1 if nearest >= car.floor else -1
+
+        here = []
+        if car.floor in stops:
+            if car.target in (None, car.floor):
+                here = [car.floor]
+            elif direction > 0:
+                # The car is leaving that floor, it comes back on its way down
+                below.insert(0, car.floor)
+            else:
+                above.insert(0, car.floor)
+
+        if direction > 0:
+            return here + above + self._turn(above, below, self.top_floor) + below
+        return here + below + self._turn(below, above, 0) + above
+
+    def _turn(self, ahead: t.List[int], behind: t.List[int], end: int) -> t.List[int]:
+        return []
+
+
+class ScanPolicy(LookPolicy):
+    def _turn(self, ahead: t.List[int], behind: t.List[int], end: int) -> t.List[int]:
+        # Go all the way to the end of the building before serving the stops behind
+        if behind and (not ahead or ahead[-1] != end):
+            return [end]
+        return []
+
+
+class Dispatcher:
+    def __init__(
+            self,
+            elevator_apis: t.Sequence[ElevatorApi],
+            policy: DispatchPolicy,
+            emergency_center: EmergencyCenter):
+        self.cars = [Car(str(number), api) for number, api in enumerate(elevator_apis)]
+        self.policy = policy
+        self.emergency_center = emergency_center
+        self.pending: t.List[NumberButtonCommand] = []
+
+    def submit(self, command: NumberButtonCommand) -> None:
+        self.pending.append(command)
+
+    def dispatch(self) -> t.Dict[int, Car]:
+        """ Assign every pending request to a car and reorder the stops of the cars. """
+        assignments = {}
+        requests, self.pending = self.pending, []
+        for command in requests:
+            car = self.policy.choose_car(self.available_cars(), command.number)
+            car.stops = self.policy.order_stops(car, car.stops + [command.number])
+            assignments[command.number] = car
+
+        for car in self.cars:
+            if car.stops:
+                car.wakeup.set()
+
+        return assignments
+
+    def available_cars(self) -> t.List[Car]:
+        """ The cars that can take new requests. """
+        return self.cars
+
+    def next_stop(self, car: Car) -> t.Optional[int]:
+        """ Take the next stop of the car and return it, or None when it has nothing to do. """
+        if not car.stops:
+            car.direction = 0
+            return None
+
+        stop = car.target = car.stops.pop(0)
+        car.direction = (stop > car.floor) - (stop < car.floor)
+        return stop
+
+    def arrived(self, car: Car, floor: int) -> None:
+        """ Called by drive when a car reached one of its stops. """
+
+    def command_for(self, car: Car, floor: int) -> NumberButtonCommand:
+        return NumberButtonCommand(floor, car.elevator_api, self.emergency_center)
+
+    async def drive(self, car: Car) -> None:
+        """ Serve the stops of a car forever. The car needs an AsyncElevatorApi. """
+        while True:
+            stop = self.next_stop(car)
+            if stop is None:
+                car.wakeup.clear()
+                await car.wakeup.wait()
+                continue
+
+            self.command_for(car, stop).execute()
+            await car.elevator_api.wait_idle()
+            car.target = None
+            self.arrived(car, stop)
+
+
+def compare_policies(
+        cars: int = 4,
+        top_floor: int = 30,
+        requests: int = 200,
+        seed: int = 0) -> None:
+    """ Assign one burst of requests with every policy and serve them, counting floors:
+    the wait of a request is the distance its car travels before reaching its floor.
+    """
+    rng = random.Random(seed)
+    starts = [rng.randint(0, top_floor) for _ in range(cars)]
+    floors = [rng.randint(0, top_floor) for _ in range(requests)]
+    emergency_center = EmergencyCenter()
+
+    for policy_type in (NearestCarPolicy, LookPolicy, ScanPolicy):
+        apis = []
+        for start in starts:
+            api = ElevatorApi()
+            api.current_floor = start
+            apis.append(api)
+
+        dispatcher = Dispatcher(apis, policy_type(top_floor), emergency_center)
+        for floor in floors:
+            dispatcher.submit(NumberButtonCommand(floor, apis[0], emergency_center))
+        dispatcher.dispatch()
+
+        waits = []
+        travel = 0
+        for car in dispatcher.cars:
+            travelled = 0
+            requested = set(car.stops)
+            while (stop := dispatcher.next_stop(car)) is not None:
+                travelled += abs(stop - car.floor)
+                # Moved without sleeping: only the planning is compared here
+                car.elevator_api.current_floor = stop
+                if stop in requested:
+                    waits.append(travelled)
+            travel += travelled
+
+        print(f'{policy_type.__name__:>16}: average wait {sum(waits) / len(waits):6.1f} floors, '
+              f'total travel {travel:5} floors')
+
+
+async def main() -> None:
+    from command_async import AsyncElevatorApi
+
+    emergency_center = EmergencyCenter()
+    apis = [AsyncElevatorApi(doors_time=0.05, travel_time=0.1) for _ in range(3)]
+    dispatcher = Dispatcher(apis, LookPolicy(top_floor=9), emergency_center)
+    for api in apis:
+        api.start()
+    drivers = [asyncio.create_task(dispatcher.drive(car)) for car in dispatcher.cars]
+
+    for floor in (5, 2, 8, 3, 9, 1):
+        dispatcher.submit(NumberButtonCommand(floor, apis[0], emergency_center))
+    for floor, car in dispatcher.dispatch().items():
+        print(f'Floor {floor} -> car {car.name}')
+    print(dispatcher.cars)
+
+    await asyncio.sleep(2)
+    print('Cars at floors', [car.floor for car in dispatcher.cars])
+    for task in drivers:
+        task.cancel()
+    for api in apis:
+        await api.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+    compare_policies()
@@ -0,0 +1,207 @@
+""" Trying an elevator change takes real time, because the cars wait on the wall clock
+while they move.
+
+Run the asyncio elevators on a virtual clock instead: the event loop below never
+waits, when nothing is ready it moves its clock forward to the next timer. The
+existing classes run unchanged on top of it (the buttons' NumberButtonCommand, the
+AsyncElevatorApi receivers and the Dispatcher with its policies), so a full day of
+passengers is replayed in seconds.
+
+The simulation reports, for every dispatch policy:
+- the throughput, in passengers delivered per hour
+- the distribution of the waiting times (from the arrival on the floor to boarding)
+- the distribution of the travel times (from boarding to the destination floor)
+"""
+
+import asyncio
+import collections
+import contextlib
+import os
+import random
+import selectors
+import statistics
+import time
+import typing as t
+
+from command import EmergencyCenter, NumberButtonCommand
+from command_async import AsyncElevatorApi
+from command_dispatch import Car, DispatchPolicy, Dispatcher, LookPolicy, NearestCarPolicy, ScanPolicy
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0) -> None:
+        self.now = start
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """ Never blocks: waiting for a timeout moves the clock forward instead. """
+
+    def __init__(self, clock: VirtualClock) -> None:
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout: t.Optional[float] = None) -> t.List:
+        events = super().select(0)
+        if not events:
+            if timeout is None:
+                raise RuntimeError('The simulation is stuck: nothing is scheduled')
+            self.clock.now += timeout
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """ An event loop telling the time of the injected clock. """
+
+    def __init__(self, clock: t.Optional[VirtualClock] = None) -> None:
+        self.clock = clock or VirtualClock()
+        super().__init__(_VirtualSelector(self.clock))
+
+    def time(self) -> float:
+        return self.clock.now
+
+
+class Passenger:
+    def __init__(self, arrival: float, origin: int, destination: int) -> None:
+        self.arrival = arrival
+        self.origin = origin
+        self.destination = destination
+        self.boarded: t.Optional[float] = None
+        self.delivered: t.Optional[float] = None
+
+
+def synthetic_day(top_floor: int, passengers_per_hour: int = 300, seed: int = 0) -> t.List[Passenger]:
+    """ Office building traffic: up-peak in the morning, lunch, down-peak in the evening. """
+    rng = random.Random(seed)
+    # Relative traffic of every hour of the day
+    profile = [0.02] * 7 + [0.6, 1.0, 0.4, 0.3, 0.3, 0.8, 0.8, 0.3, 0.3, 0.4, 1.0, 0.6, 0.2] + [0.02] * 4
+    passengers = []
+    now = 0.0
+    while True:
+        rate = passengers_per_hour * profile[int(now // HOUR)] / HOUR
+        now += rng.expovariate(rate)
+        if now >= DAY:
+            return passengers
+
+        hour = int(now // HOUR)
+        floor = rng.randint(1, top_floor)
+        if 7 <= hour < 10 or hour == 13:
+            origin, destination = 0, floor  # arriving at the office, back from lunch
+        elif hour == 12 or 17 <= hour < 20:
+            origin, destination = floor, 0  # going out
+        else:
+            origin, destination = rng.sample(range(top_floor + 1), 2)
+
+        if origin != destination:
+            passengers.append(Passenger(now, origin, destination))
+
+
+class SimulatedBuilding(Dispatcher):
+    """ A dispatcher that also moves passengers in and out of the cars it drives. """
+
+    def __init__(self, cars: int, policy: DispatchPolicy, capacity: int, **api_options: float) -> None:
+        apis = [AsyncElevatorApi(**api_options) for _ in range(cars)]
+        super().__init__(apis, policy, EmergencyCenter())
+        self.capacity = capacity
+        self.waiting: t.Dict[int, t.Deque[Passenger]] = collections.defaultdict(collections.deque)
+        self.riding: t.Dict[Car, t.List[Passenger]] = {car: [] for car in self.cars}
+        self.delivered: t.List[Passenger] = []
+        self._all_delivered = asyncio.Event()
+        self._expected = 0
+
+    def available_cars(self) -> t.List[Car]:
+        # Full cars are not sent to pick up more passengers
+        cars = [car for car in self.cars if len(self.riding[car]) < self.capacity]
+        return cars or self.cars
+
+    def arrived(self, car: Car, floor: int) -> None:
+        now = asyncio.get_running_loop().time()
+        riding = self.riding[car]
+        for passenger in [passenger for passenger in riding if passenger.destination == floor]:
+            passenger.delivered = now
+            riding.remove(passenger)
+            self.delivered.append(passenger)
+
+        waiting = self.waiting[floor]
+        destinations = []
+        while waiting and len(riding) < self.capacity:
+            passenger = waiting.popleft()
+            passenger.boarded = now
+            riding.append(passenger)
+            destinations.append(passenger.destination)
+
+        if destinations:
+            # The passengers inside press the buttons of their floors
+            car.stops = self.policy.order_stops(car, car.stops + destinations)
+            car.wakeup.set()
+
+        if waiting and floor not in car.stops:
+            # The car was full: call another one for the passengers left behind
+            self.submit(NumberButtonCommand(floor, car.elevator_api, self.emergency_center))
+            asyncio.get_running_loop().call_soon(self.dispatch)
+
+        if len(self.delivered) == self._expected:
+            self._all_delivered.set()
+
+    async def replay(self, passengers: t.List[Passenger]) -> None:
+        loop = asyncio.get_running_loop()
+        self._expected = len(passengers)
+        for car in self.cars:
+            car.elevator_api.start()
+        drivers = [asyncio.create_task(self.drive(car)) for car in self.cars]
+
+        for passenger in passengers:
+            await asyncio.sleep(passenger.arrival - loop.time())
+            self.waiting[passenger.origin].append(passenger)
+            # The hall button of the floor, it is handed to the dispatcher
+            self.submit(NumberButtonCommand(passenger.origin, self.cars[0].elevator_api, self.emergency_center))
+            self.dispatch()
+
+        await self._all_delivered.wait()
+        for task in drivers:
+            task.cancel()
+        for car in self.cars:
+            await car.elevator_api.stop()
+
+
+def _distribution(values: t.List[float]) -> str:
+    percentiles = statistics.quantiles(values, n=100)
+    return (f'mean {statistics.fmean(values):6.1f}s, p50 {percentiles[49]:6.1f}s, '
+            f'p90 {percentiles[89]:6.1f}s, p99 {percentiles[98]:6.1f}s, max {max(values):6.1f}s')
+
+
+def simulate_day(
+        policy_type: t.Type[DispatchPolicy],
+        cars: int = 4,
+        top_floor: int = 20,
+        capacity: int = 12,
+        passengers_per_hour: int = 300,
+        seed: int = 0) -> None:
+    passengers = synthetic_day(top_floor, passengers_per_hour, seed)
+    building = SimulatedBuilding(
+        cars, policy_type(top_floor), capacity, doors_time=3, travel_time=2, floor_time=1.5)
+
+    loop = VirtualTimeEventLoop()
+    start = time.perf_counter()
+    # The receivers print every move, a day of them is not worth reading
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        loop.run_until_complete(building.replay(passengers))
+    loop.close()
+    elapsed = time.perf_counter() - start
+
+    delivered = building.delivered
+    last_delivery = max(passenger.delivered for passenger in delivered)
+    per_hour = collections.Counter(int(passenger.delivered // HOUR) for passenger in delivered)
+    print(f'{policy_type.__name__}: {len(delivered)} passengers, simulated {last_delivery / HOUR:.1f}h '
+          f'in {elapsed:.1f}s, busiest hour {max(per_hour.values())} passengers/h')
+    print('    wait:  ', _distribution([p.boarded - p.arrival for p in delivered]))
+    print('    travel:', _distribution([p.delivered - p.boarded for p in delivered]))
+
+
+if __name__ == '__main__':
+    for passengers_per_hour in (300, 1_500):
+        print(f'Peak demand of {passengers_per_hour} passengers/h')
+        for policy_type in (NearestCarPolicy, LookPolicy, ScanPolicy):
+            simulate_day(policy_type, passengers_per_hour=passengers_per_hour)
@@ -5,7 +5,15 @@ and offers the same basic functionalities that a client would expect from
 a banking application.
 """
 import abc
+import array
+import contextlib
 import enum
+import itertools
+import math
+import random
+import threading
+import time
+import typing as t
 
 
 class InsufficientFundsError(Exception):
@@ -24,12 +32,57 @@ class TooMuchDebtError(Exception):
     pass
 
 
+class CreditNotAvailableError(Exception):
+    pass
+
+
+class UnknownAccountError(Exception):
+    pass
+
+
+class DuplicateAccountError(Exception):
+    pass
+
+
 class AccountState(enum.Enum):
     OPENED = enum.auto()
     CLOSED = enum.auto()
 
 
+MINOR_UNITS = 100  # minor units (cents) in a major unit of the currency
+
+_account_numbers = itertools.count(1)
+
+
+def generate_iban(country: str = 'RO', bank: str = 'DPBK') -> str:
+    """ Build a unique IBAN with valid check digits (ISO 13616, mod 97). """
+    bban = f'{bank}{next(_account_numbers):016d}'
+    digits = ''.join(str(int(char, 36)) for char in f'{bban}{country}00')
+    return f'{country}{98 - int(digits) % 97:02d}{bban}'
+
+
+def skip_account_numbers(ibans: t.Iterable[str]) -> None:
+    """ Make generate_iban continue after the account numbers of existing IBANs,
+    e.g. the accounts restored after a restart.
+    """
+    global _account_numbers
+    highest = max((int(iban[-16:]) for iban in ibans if iban[-16:].isdigit()), default=0)
+    _account_numbers = itertools.count(max(next(_account_numbers), highest + 1))
+
+
+def is_whole_minor_units(amount: float) -> bool:
+    """ Whether an amount given in major units is a whole number of minor units. """
+    units = amount * MINOR_UNITS
+    # The tolerance absorbs the float noise of amounts like 0.1 + 0.2
+    return abs(units - round(units)) < 1e-6
+
+
 class Account(abc.ABC):
+    __slots__ = ()
+
+    iban: str
+    lock: threading.RLock
+
     @abc.abstractmethod
     def balance(self) -> float:
         pass
@@ -50,51 +103,82 @@ class Account(abc.ABC):
     def display(self) -> str:
         pass
 
+    def add_funds(self, amount: float) -> None:
+        """ Add money moved by a transfer, or take it when the amount is negative.
+        The caller holds the lock of the account.
+        """
+        self.funds += amount
+
+
+@contextlib.contextmanager
+def locked(*accounts: Account) -> t.Iterator[None]:
+    """ Hold the locks of all the given accounts.
+
+    Locks are always taken in the same global order (by identity), so two threads
+    locking overlapping accounts can never wait on each other in a cycle. A lock
+    shared by several accounts is taken once.
+    """
+    locks = {id(account.lock): account.lock for account in accounts}
+    ordered = [lock for _, lock in sorted(locks.items())]
+    acquired = []
+    try:
+        for lock in ordered:
+            lock.acquire()
+            acquired.append(lock)
+        yield
+    finally:
+        for lock in reversed(acquired):
+            lock.release()
+
 
 class PersonalAccount(Account):
-    def __init__(self, initial_funds: int = 0):
-        self.iban = 'RO23XYZ123456789'
+    def __init__(self, initial_funds: int = 0, iban: t.Optional[str] = None):
+        self.iban = iban or generate_iban()
         self.funds = initial_funds
         self.debt = 0
         self.state = AccountState.OPENED
         self._credit_interest = 0.069
+        self.lock = threading.RLock()
 
     def balance(self) -> float:
         return self.funds
 
     def transfer(self, account: Account, amount: float) -> None:
-        if self.funds < amount:
-            raise InsufficientFundsError('Not enough funds in the account')
+        with locked(self, account):
+            if self.funds < amount:
+                raise InsufficientFundsError('Not enough funds in the account')
 
-        if self.state == AccountState.CLOSED:
-            raise AccountClosedError('The account is not opened')
+            if self.state == AccountState.CLOSED:
+                raise AccountClosedError('The account is not opened')
 
-        source_funds = self.funds
-        destination_funds = account.funds
+            source_funds = self.funds
+            destination_funds = account.funds
 
-        try:
-            self.funds -= amount
-            account.funds += amount
-        except Exception as e:
-            print(f'Transaction failed with error {e}. Rollback...')
-            self.funds = source_funds
-            account.funds = destination_funds
+            try:
+                self.funds -= amount
+                account.funds += amount
+            except Exception as e:
+                print(f'Transaction failed with error {e}. Rollback...')
+                self.funds = source_funds
+                account.funds = destination_funds
 
     def close(self):
-        if self.funds:
-            raise TooManyFundsError('The account has to be empty in order to close it.')
+        with self.lock:
+            if self.funds:
+                raise TooManyFundsError('The account has to be empty in order to close it.')
 
-        if self.debt:
-            raise TooMuchDebtError('The debt must be paid before closing the account')
+            if self.debt:
+                raise TooMuchDebtError('The debt must be paid before closing the account')
 
-        self.state = AccountState.CLOSED
+            self.state = AccountState.CLOSED
 
     def borrow(self, amount: float) -> None:
-        if self.state == AccountState.CLOSED:
-            raise AccountClosedError('The account is not opened')
+        with self.lock:
+            if self.state == AccountState.CLOSED:
+                raise AccountClosedError('The account is not opened')
 
-        self.debt += amount + amount * self._credit_interest
-        self.funds += amount
+            self.debt += amount
+            self.funds += amount
 
     def display(self) -> str:
         return 'Acc. Type: {type}\nAcc. State: {state}\nBalance: {balance:.2f}\nDebt: {debt:.2f}'.format(
@@ -106,38 +190,45 @@ class PersonalAccount(Account):
 
 
 class DepositAccount(Account):
-    def __init__(self) -> None:
-        self.iban = 'RO31ABCD987654321'
+    def __init__(self, iban: t.Optional[str] = None) -> None:
+        self.iban = iban or generate_iban()
         self.funds = 0
         self.interest = 0.003
         self.state = AccountState.OPENED
+        self.lock = threading.RLock()
 
     def balance(self) -> float:
-        return self.funds + self.funds * self.interest
+        # The interest is added to the funds every day by accrue_interest
+        return self.funds
 
     def transfer(self, account: 'Account', amount: float) -> None:
-        if self.funds < amount:
-            raise InsufficientFundsError('Not enough funds in the account')
+        with locked(self, account):
+            if self.funds < amount:
+                raise InsufficientFundsError('Not enough funds in the account')
 
-        if self.state == AccountState.CLOSED:
-            raise AccountClosedError('The account is not opened')
+            if self.state == AccountState.CLOSED:
+                raise AccountClosedError('The account is not opened')
 
-        source_funds = self.funds
-        destination_funds = account.funds
+            source_funds = self.funds
+            destination_funds = account.funds
 
-        try:
-            self.funds -= amount
-            account.funds += amount
-        except Exception as e:
-            print(f'Transaction failed with error {e}. Rollback...')
-            self.funds = source_funds
-            account.funds = destination_funds
+            try:
+                self.funds -= amount
+                account.funds += amount
+            except Exception as e:
+                print(f'Transaction failed with error {e}. Rollback...')
+                self.funds = source_funds
+                account.funds = destination_funds
 
     def close(self):
-        if self.funds:
-            raise TooManyFundsError('The account has to be empty in order to close it.')
+        with self.lock:
+            if self.funds:
+                raise TooManyFundsError('The account has to be empty in order to close it.')
 
-        self.state = AccountState.CLOSED
+            self.state = AccountState.CLOSED
+
+    def borrow(self, amount: float) -> None:
+        raise CreditNotAvailableError('Deposit accounts cannot borrow money')
 
     def display(self) -> str:
         return 'Acc. Type: {type}\nAcc. State: {state}\nBalance: {balance:.2f}\nInterest rate: {interest:.3f}'.format(
@@ -148,34 +239,288 @@ class DepositAccount(Account):
         )
 
 
+ACCOUNT_TYPES = {
+    account_type.__name__: account_type
+    for account_type in (PersonalAccount, DepositAccount)
+}
+
+
+def account_state(account: Account) -> t.Dict[str, t.Any]:
+    """ The state of an account as plain data, to store it or send it elsewhere. """
+    state = {
+        'type': type(account).__name__,
+        'iban': account.iban,
+        'funds': account.funds,
+        'state': account.state.name,
+    }
+    if isinstance(account, PersonalAccount):
+        state['debt'] = account.debt
+
+    return state
+
+
+def restore_account(state: t.Dict[str, t.Any]) -> Account:
+    account = ACCOUNT_TYPES[state['type']](iban=state['iban'])
+    account.funds = state['funds']
+    account.state = AccountState[state['state']]
+    if 'debt' in state:
+        account.debt = state['debt']
+
+    return account
+
+
+class TransferBatchResult(t.NamedTuple):
+    applied: int
+    rejected: t.List[t.Tuple[int, str]]  # (row, reason)
+
+
+class InterestAccrual(t.NamedTuple):
+    deposit_interest: float
+    loan_interest: float
+
+
+def accrue_interest(accounts: t.Iterable[Account], days_in_year: int = 365) -> InterestAccrual:
+    """ Add one day of interest to the funds of deposit accounts and to the debt
+    of personal accounts. The rates of the accounts are yearly.
+
+    The accounts are updated one by one: copying their balances into columns and
+    back costs more than the arithmetic it saves, so no vectorized pass is kept.
+    The totals add up what was actually written to the accounts. The callers hold
+    their locks.
+    """
+    deposit_interest, loan_interest = [], []
+    for account in accounts:
+        if isinstance(account, DepositAccount):
+            funds = account.funds
+            account.funds = funds + funds * account.interest / days_in_year
+            deposit_interest.append(account.funds - funds)
+        elif isinstance(account, PersonalAccount):
+            debt = account.debt
+            account.debt = debt + debt * account._credit_interest / days_in_year
+            loan_interest.append(account.debt - debt)
+
+    return InterestAccrual(math.fsum(deposit_interest), math.fsum(loan_interest))
+
+
+class AccountRegistry:
+    """ Accounts indexed by IBAN, and by account type for iteration. """
+
+    def __init__(self):
+        self._accounts: t.Dict[str, Account] = {}
+        self._by_type: t.Dict[type, t.Dict[str, Account]] = {}
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def __iter__(self) -> t.Iterator[Account]:
+        return iter(self._accounts.values())
+
+    def __contains__(self, iban: str) -> bool:
+        return iban in self._accounts
+
+    def register(self, account: Account) -> None:
+        if account.iban in self._accounts:
+            raise DuplicateAccountError(f'An account with IBAN {account.iban} already exists')
+
+        self._accounts[account.iban] = account
+        self._by_type.setdefault(type(account), {})[account.iban] = account
+
+    def register_many(self, accounts: t.Iterable[Account]) -> None:
+        accounts = list(accounts)
+        ibans = {account.iban for account in accounts}
+        if len(ibans) < len(accounts) or not ibans.isdisjoint(self._accounts):
+            raise DuplicateAccountError('Some of the accounts are already registered')
+
+        for account in accounts:
+            self._accounts[account.iban] = account
+            self._by_type.setdefault(type(account), {})[account.iban] = account
+
+    def get(self, iban: str) -> Account:
+        try:
+            return self._accounts[iban]
+        except KeyError:
+            raise UnknownAccountError(f'No account with IBAN {iban}') from None
+
+    def by_type(self, account_type: t.Type[Account]) -> t.Iterator[Account]:
+        return iter(self._by_type.get(account_type, {}).values())
+
+
 class BankingApplication:
     def __init__(self):
-        self.accounts = []
+        self.accounts = AccountRegistry()
         self.current_account = None
 
     def add_account(self, account) -> None:
-        self.accounts.append(account)
+        self.accounts.register(account)
+
+    def add_accounts(self, accounts: t.Iterable[Account]) -> None:
+        self.accounts.register_many(accounts)
 
-    def set_current_account(self, account: Account) -> None:
-        if account in self.accounts:
-            self.current_account = account
+    def get_account(self, account: t.Union[Account, str]) -> Account:
+        """ Find a managed account from its IBAN (or from the account itself). """
+        iban = account if isinstance(account, str) else account.iban
+        return self.accounts.get(iban)
+
+    def set_current_account(self, account: t.Union[Account, str]) -> None:
+        iban = account if isinstance(account, str) else account.iban
+        if iban in self.accounts:
+            self.current_account = self.accounts.get(iban)
 
     def list_accounts(self) -> None:
         for account in self.accounts:
             print(account.display())
             print('-' * 50)
 
-    def make_transfer(self, destination_account: Account, amount: float) -> None:
+    def make_transfer(self, destination_account: t.Union[Account, str], amount: float) -> None:
+        if isinstance(destination_account, str):
+            destination_account = self.accounts.get(destination_account)
+
         self.current_account.transfer(destination_account, amount)
 
+    def make_transfers(
+            self,
+            sources: t.Sequence[t.Union[Account, str]],
+            destinations: t.Sequence[t.Union[Account, str]],
+            amounts: t.Sequence[float]) -> TransferBatchResult:
+        """ Apply many transfers at once.
+
+        Every row is checked against a column of the funds the accounts had before
+        the batch, so money received in a batch can only be spent in the next one.
+        Valid rows are summed into a column of balance deltas that is written back
+        to the accounts in one step: either all of them are applied or none is.
+        Accounts can be given as objects or IBANs. Only the accounts of the batch
+        are locked, so a batch costs as much as its rows. Amounts below a cent are
+        refused, since accounts that count in cents could not apply them.
+        """
+        if not len(sources) == len(destinations) == len(amounts):
+            raise ValueError('A batch needs as many sources, destinations and amounts')
+
+        accounts, source_positions, destination_positions = self.batch_accounts(sources, destinations)
+        # Balances are read and written under the locks of every account of the batch
+        with locked(*accounts):
+            available = array.array('d', (account.funds for account in accounts))
+            opened = [account.state == AccountState.OPENED for account in accounts]
+            deltas = array.array('d', bytes(8 * len(accounts)))
+            rejected = []
+
+            rows = zip(source_positions, destination_positions, amounts)
+            for row, (source, destination, amount) in enumerate(rows):
+                if source is None or destination is None:
+                    rejected.append((row, 'The account is not managed by the application'))
+                elif amount <= 0:
+                    rejected.append((row, 'The amount must be positive'))
+                elif not is_whole_minor_units(amount):
+                    rejected.append((row, 'The amount must be a whole number of cents'))
+                elif available[source] < amount:
+                    rejected.append((row, 'Not enough funds in the account'))
+                elif not opened[source]:
+                    rejected.append((row, 'The account is not opened'))
+                else:
+                    available[source] -= amount
+                    deltas[source] -= amount
+                    deltas[destination] += amount
+
+            funds = [account.funds for account in accounts]
+            try:
+                for account, delta in zip(accounts, deltas):
+                    if delta:
+                        account.add_funds(delta)
+            except Exception as e:
+                print(f'Batch failed with error {e}. Rollback...')
+                for account, previous_funds in zip(accounts, funds):
+                    account.funds = previous_funds
+                raise
+
+        return TransferBatchResult(len(amounts) - len(rejected), rejected)
+
+    def batch_accounts(
+            self,
+            sources: t.Sequence[t.Union[Account, str]],
+            destinations: t.Sequence[t.Union[Account, str]]) -> t.Tuple[t.List[Account], t.List, t.List]:
+        """ The distinct managed accounts of a batch, and the position of every source
+        and destination among them (None for an account that is not managed).
+        """
+        accounts = []
+        positions: t.Dict[str, int] = {}
+        columns = []
+        for column in (sources, destinations):
+            columns.append([])
+            for account in column:
+                iban = account if isinstance(account, str) else account.iban
+                position = positions.get(iban)
+                if position is None and iban in self.accounts:
+                    position = positions[iban] = len(accounts)
+                    accounts.append(self.accounts.get(iban))
+                columns[-1].append(position)
+
+        return accounts, columns[0], columns[1]
+
+    def accrue_interest(self, days_in_year: int = 365) -> InterestAccrual:
+        """ End of day job: one day of interest on every managed account. """
+        with locked(*self.accounts):
+            return accrue_interest(self.accounts, days_in_year)
+
+    def credit(self, account: t.Union[Account, str], amount: float) -> None:
+        """ Lend money to a managed account, without a current account. Only
+        personal accounts get credit.
+        """
+        account = self.get_account(account)
+        if isinstance(account, PersonalAccount):
+            account.borrow(amount)
+
     def make_credit(self, amount: float) -> None:
-        if isinstance(self.current_account, PersonalAccount):
-            self.current_account.borrow(amount)
+        if self.current_account is not None:
+            self.credit(self.current_account, amount)
 
     def close(self) -> None:
         self.current_account.close()
 
 
+def benchmark_transfers(accounts: int, transfers: int) -> None:
+    app = BankingApplication()
+    for _ in range(accounts):
+        app.add_account(PersonalAccount(initial_funds=1_000))
+
+    sources = random.choices(list(app.accounts), k=transfers)
+    destinations = random.choices(list(app.accounts), k=transfers)
+    amounts = [random.randint(1, 100) for _ in range(transfers)]
+
+    start = time.perf_counter()
+    for source, destination, amount in zip(sources, destinations, amounts):
+        app.set_current_account(source)
+        try:
+            app.make_transfer(destination, amount)
+        except (InsufficientFundsError, AccountClosedError):
+            pass
+    loop_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app.make_transfers(sources, destinations, amounts)
+    batch_elapsed = time.perf_counter() - start
+
+    print(f'Per-call loop: {transfers / loop_elapsed:12,.0f} transfers/s')
+    print(f'Batch:         {transfers / batch_elapsed:12,.0f} transfers/s')
+
+
+def benchmark_interest_accrual(accounts: int) -> None:
+    app = BankingApplication()
+    for number in range(accounts):
+        if number % 2:
+            account = DepositAccount()
+            account.funds = random.randint(0, 10_000)
+        else:
+            account = PersonalAccount()
+            account.debt = random.randint(0, 10_000)
+        app.add_account(account)
+
+    with locked(*app.accounts):
+        start = time.perf_counter()
+        accrue_interest(app.accounts)
+        elapsed = time.perf_counter() - start
+
+    print(f'Interest accrual for {accounts:,} accounts: {elapsed:.2f}s')
+
+
 if __name__ == '__main__':
     personal_account = PersonalAccount(initial_funds=2000)
     economies = DepositAccount()
@@ -187,10 +532,23 @@ if __name__ == '__main__':
     app.set_current_account(personal_account)
 
     app.make_credit(5000)
-    app.make_transfer(economies, 1000)
+    app.make_transfer(economies.iban, 1000)
 
     app.list_accounts()
 
+    result = app.make_transfers(
+        [personal_account, economies, personal_account],
+        [economies, personal_account, economies],
+        [500, 5000, 100])
+    print('Applied transfers:', result.applied, 'rejected:', result.rejected)
+    print('Deposit accounts:', [account.iban for account in app.accounts.by_type(DepositAccount)])
+
+    print('Interest accrued today:', app.accrue_interest())
+    app.list_accounts()
+
+    benchmark_transfers(accounts=1_000, transfers=200_000)
+    benchmark_interest_accrual(accounts=1_000_000)
+
     app.close()
 
 
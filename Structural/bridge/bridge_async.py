@@ -0,0 +1,217 @@
+"""
+Many clients use the banking application at the same time, but every operation
+of BankingApplication is a synchronous call and list_accounts only prints.
+
+Serve the operations through an asyncio service instead:
+- transfer and credit requests are put on a queue and every caller gets back a
+  future to await
+- a single batcher task takes everything queued within a short delay (up to a
+  maximum batch size) and applies it as one bulk update: the credits one after
+  the other, then all the transfers with a single make_transfers call
+- the ledger work runs on a worker thread, so the event loop keeps accepting
+  requests while a batch is applied
+"""
+import asyncio
+import random
+import statistics
+import time
+import typing as t
+
+from bridge import (
+    Account,
+    BankingApplication,
+    PersonalAccount,
+    account_state,
+)
+
+
+class TransferRejectedError(Exception):
+    pass
+
+
+class ServiceClosedError(Exception):
+    pass
+
+
+class _Request(t.NamedTuple):
+    kind: str  # 'transfer' or 'credit'
+    args: t.Tuple
+    future: asyncio.Future
+
+
+class AsyncBankingService:
+    def __init__(self, app: BankingApplication, max_batch: int = 1_024, max_delay: float = 0.001):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: t.Optional[asyncio.Queue] = None
+        self._batcher: t.Optional[asyncio.Task] = None
+        self.batches = 0
+
+    async def __aenter__(self) -> 'AsyncBankingService':
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: t.Any) -> None:
+        await self.stop()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batches())
+
+    async def stop(self) -> None:
+        """ Apply what is already queued, then stop the batcher. """
+        await self._queue.join()
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        self._batcher = None
+
+    async def transfer(
+            self,
+            source: t.Union[Account, str],
+            destination: t.Union[Account, str],
+            amount: float) -> None:
+        """ Move money between two accounts. Rejected transfers raise TransferRejectedError. """
+        await self._submit('transfer', source, destination, amount)
+
+    async def credit(self, account: t.Union[Account, str], amount: float) -> None:
+        await self._submit('credit', account, amount)
+
+    async def list_accounts(self) -> t.List[t.Dict[str, t.Any]]:
+        """ The state of every account, as data instead of printed text. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, lambda: [account_state(account) for account in self.app.accounts])
+
+    async def _submit(self, kind: str, *args: t.Any) -> None:
+        if self._batcher is None:
+            raise ServiceClosedError('The service is not running')
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Request(kind, args, future))
+        await future
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Give the other clients a moment to queue, unless a full batch is waiting
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                outcomes = await loop.run_in_executor(None, self._apply, batch)
+            except Exception as e:
+                outcomes = [e] * len(batch)
+
+            for request, outcome in zip(batch, outcomes):
+                if request.future.done():
+                    continue
+                if outcome is None:
+                    request.future.set_result(None)
+                else:
+                    request.future.set_exception(outcome)
+
+            self.batches += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    def _apply(self, batch: t.List[_Request]) -> t.List[t.Optional[Exception]]:
+        """ Runs on the worker thread. Returns the error of every request, or None. """
+        outcomes: t.List[t.Optional[Exception]] = [None] * len(batch)
+        transfers = []
+        for position, request in enumerate(batch):
+            if request.kind == 'credit':
+                account, amount = request.args
+                try:
+                    # Not through make_credit, which would change the app's current account
+                    self.app.credit(account, amount)
+                except Exception as e:
+                    outcomes[position] = e
+            else:
+                transfers.append(position)
+
+        if transfers:
+            sources, destinations, amounts = zip(*(batch[position].args for position in transfers))
+            result = self.app.make_transfers(sources, destinations, amounts)
+            for row, reason in result.rejected:
+                outcomes[transfers[row]] = TransferRejectedError(reason)
+
+        return outcomes
+
+
+async def _client(
+        service: AsyncBankingService,
+        accounts: t.List[str],
+        requests: int,
+        latencies: t.List[float],
+        seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            if rng.random() < 0.05:
+                await service.credit(rng.choice(accounts), rng.randint(1, 100))
+            else:
+                source, destination = rng.sample(accounts, 2)
+                await service.transfer(source, destination, rng.randint(1, 50))
+        except TransferRejectedError:
+            pass
+        latencies.append(time.perf_counter() - start)
+
+
+async def generate_load(
+        clients: int,
+        requests_per_client: int,
+        accounts: int = 1_000,
+        max_batch: int = 1_024) -> None:
+    app = BankingApplication()
+    for _ in range(accounts):
+        app.add_account(PersonalAccount(initial_funds=1_000))
+    ibans = [account.iban for account in app.accounts]
+
+    latencies: t.List[float] = []
+    async with AsyncBankingService(app, max_batch=max_batch) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _client(service, ibans, requests_per_client, latencies, seed)
+            for seed in range(clients)
+        ))
+        elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f'{clients:>5} clients, batches of up to {max_batch:>5}: '
+          f'{len(latencies) / elapsed:9,.0f} requests/s, '
+          f'p50 {percentiles[49] * 1000:6.2f}ms, p99 {percentiles[98] * 1000:6.2f}ms, '
+          f'{len(latencies) / service.batches:6.1f} requests/batch')
+
+
+async def main() -> None:
+    personal_account = PersonalAccount(initial_funds=2000)
+    other_account = PersonalAccount()
+
+    app = BankingApplication()
+    app.add_account(personal_account)
+    app.add_account(other_account)
+
+    async with AsyncBankingService(app) as service:
+        results = await asyncio.gather(
+            service.credit(personal_account, 5000),
+            service.transfer(personal_account, other_account, 1000),
+            service.transfer(other_account, personal_account, 5000),
+            return_exceptions=True,
+        )
+        print('Results:', results)
+        print('Accounts:', await service.list_accounts())
+
+    for max_batch in (1, 1_024):
+        await generate_load(clients=1_000, requests_per_client=20, max_batch=max_batch)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,273 @@
+"""
+Some clients of the banking application manage millions of accounts.
+
+The accounts of bridge.py keep their money as floats in a per-instance __dict__:
+every account costs a few hundred bytes and the floats drift a little on every
+operation. The compact accounts below keep the same Account interface but:
+- store money as an integer number of minor units (cents), so additions and
+  subtractions are exact
+- keep the fraction of a minor unit left by the daily interest aside, until it
+  adds up to a whole one
+- declare __slots__, so an account has no __dict__
+- pack the account state into a small int of flags
+- share a pool of locks instead of owning one each
+- keep the interest rates on the class, since every account uses the same ones
+
+`funds`, `debt` and `state` stay available as properties, so the compact accounts
+work with BankingApplication, the journal, the shards and the interest accrual.
+"""
+import math
+import random
+import threading
+import time
+import tracemalloc
+import typing as t
+
+from bridge import (
+    ACCOUNT_TYPES,
+    MINOR_UNITS,
+    Account,
+    AccountClosedError,
+    AccountState,
+    CreditNotAvailableError,
+    DepositAccount,
+    InsufficientFundsError,
+    PersonalAccount,
+    TooManyFundsError,
+    TooMuchDebtError,
+    generate_iban,
+    locked,
+)
+
+CLOSED = 1  # flag bit of a closed account
+LOCK_STRIPES = 4_096
+
+# A lock per account would weigh more than the rest of the account, so accounts
+# share a fixed pool of locks, picked from their IBAN
+_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+
+def to_minor_units(amount: float) -> int:
+    """ Convert an amount given in major units, rounding to the nearest minor unit. """
+    return round(amount * MINOR_UNITS)
+
+
+def split_minor_units(amount: float) -> t.Tuple[int, float]:
+    """ Split an amount given in major units into whole minor units and the fraction
+    of a minor unit left over, e.g. one day of interest on a small balance.
+    """
+    units = amount * MINOR_UNITS
+    # The tolerance absorbs the float noise of amounts that are whole minor units
+    whole = math.floor(units + 1e-6)
+    fraction = units - whole
+    return whole, fraction if fraction > 1e-6 else 0.0
+
+
+class CompactAccount(Account):
+    __slots__ = ('iban', '_funds', '_funds_fraction', '_flags')
+
+    def __init__(self, initial_funds: float = 0, iban: t.Optional[str] = None):
+        self.iban = iban or generate_iban()
+        self._funds = to_minor_units(initial_funds)
+        # Interest accrues in fractions of a minor unit, credited once they add up
+        self._funds_fraction = 0.0
+        self._flags = 0
+
+    @property
+    def lock(self) -> threading.RLock:
+        return _locks[hash(self.iban) % LOCK_STRIPES]
+
+    @property
+    def funds(self) -> float:
+        return (self._funds + self._funds_fraction) / MINOR_UNITS
+
+    @funds.setter
+    def funds(self, value: float) -> None:
+        self._funds, self._funds_fraction = split_minor_units(value)
+
+    def add_funds(self, amount: float) -> None:
+        # Transfers move whole minor units, only the interest leaves fractions
+        self._funds += to_minor_units(amount)
+
+    @property
+    def state(self) -> AccountState:
+        return AccountState.CLOSED if self._flags & CLOSED else AccountState.OPENED
+
+    @state.setter
+    def state(self, value: AccountState) -> None:
+        if value == AccountState.CLOSED:
+            self._flags |= CLOSED
+        else:
+            self._flags &= ~CLOSED
+
+    def transfer(self, account: Account, amount: float) -> None:
+        amount = to_minor_units(amount)
+        with locked(self, account):
+            if self._funds < amount:
+                raise InsufficientFundsError('Not enough funds in the account')
+
+            if self._flags & CLOSED:
+                raise AccountClosedError('The account is not opened')
+
+            self._funds -= amount
+            if isinstance(account, CompactAccount):
+                account._funds += amount
+            else:
+                account.add_funds(amount / MINOR_UNITS)
+
+    def close(self) -> None:
+        with self.lock:
+            if self._funds or self._funds_fraction:
+                raise TooManyFundsError('The account has to be empty in order to close it.')
+
+            self._flags |= CLOSED
+
+
+class CompactPersonalAccount(CompactAccount):
+    __slots__ = ('_debt', '_debt_fraction')
+
+    _credit_interest = 0.069
+
+    def __init__(self, initial_funds: float = 0, iban: t.Optional[str] = None):
+        super().__init__(initial_funds, iban)
+        self._debt = 0
+        self._debt_fraction = 0.0
+
+    @property
+    def debt(self) -> float:
+        return (self._debt + self._debt_fraction) / MINOR_UNITS
+
+    @debt.setter
+    def debt(self, value: float) -> None:
+        self._debt, self._debt_fraction = split_minor_units(value)
+
+    def balance(self) -> float:
+        return self.funds
+
+    def close(self) -> None:
+        with self.lock:
+            if self._funds or self._funds_fraction:
+                raise TooManyFundsError('The account has to be empty in order to close it.')
+
+            if self._debt or self._debt_fraction:
+                raise TooMuchDebtError('The debt must be paid before closing the account')
+
+            self._flags |= CLOSED
+
+    def borrow(self, amount: float) -> None:
+        amount = to_minor_units(amount)
+        with self.lock:
+            if self._flags & CLOSED:
+                raise AccountClosedError('The account is not opened')
+
+            self._debt += amount
+            self._funds += amount
+
+    def display(self) -> str:
+        return 'Acc. Type: {type}\nAcc. State: {state}\nBalance: {balance:.2f}\nDebt: {debt:.2f}'.format(
+            type=self.__class__.__name__,
+            state=self.state.name,
+            balance=self.balance(),
+            debt=self.debt
+        )
+
+
+class CompactDepositAccount(CompactAccount):
+    __slots__ = ()
+
+    interest = 0.003
+
+    def __init__(self, iban: t.Optional[str] = None):
+        super().__init__(0, iban)
+
+    def balance(self) -> float:
+        # The interest is added to the funds every day by accrue_interest
+        return self.funds
+
+    def borrow(self, amount: float) -> None:
+        raise CreditNotAvailableError('Deposit accounts cannot borrow money')
+
+    def display(self) -> str:
+        return 'Acc. Type: {type}\nAcc. State: {state}\nBalance: {balance:.2f}\nInterest rate: {interest:.3f}'.format(
+            type=self.__class__.__name__,
+            state=self.state.name,
+            balance=self.balance(),
+            interest=self.interest
+        )
+
+
+# The compact accounts behave as the regular ones wherever the application checks
+# the kind of an account (credits, interest accrual, snapshots)
+PersonalAccount.register(CompactPersonalAccount)
+DepositAccount.register(CompactDepositAccount)
+
+# Journals, snapshots and shards rebuild accounts from their type name
+ACCOUNT_TYPES.update({
+    account_type.__name__: account_type
+    for account_type in (CompactPersonalAccount, CompactDepositAccount)
+})
+
+
+def _bytes_per_account(account_type: t.Type[Account], accounts: int) -> float:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    created = [account_type(initial_funds=1_000) for _ in range(accounts)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # The list holding the accounts is not part of their cost
+    return (after - before) / len(created) - 8
+
+
+def _transfers_per_second(account_type: t.Type[Account], accounts: int, transfers: int) -> float:
+    created = [account_type(initial_funds=1_000) for _ in range(accounts)]
+    rng = random.Random(0)
+    pairs = [rng.sample(created, 2) for _ in range(transfers)]
+    amounts = [rng.randint(1, 5_000) / 100 for _ in range(transfers)]
+
+    start = time.perf_counter()
+    for (source, destination), amount in zip(pairs, amounts):
+        try:
+            source.transfer(destination, amount)
+        except InsufficientFundsError:
+            pass
+    return transfers / (time.perf_counter() - start)
+
+
+def benchmark_compact(accounts: int = 100_000, transfers: int = 200_000) -> None:
+    for account_type in (PersonalAccount, CompactPersonalAccount):
+        print(f'{account_type.__name__:>22}: '
+              f'{_bytes_per_account(account_type, accounts):6.0f} bytes/account, '
+              f'{_transfers_per_second(account_type, 1_000, transfers):9,.0f} transfers/s')
+
+    # Rounding drift: move 0.10 between two accounts many times, then move it all back
+    for account_type in (PersonalAccount, CompactPersonalAccount):
+        source, destination = account_type(initial_funds=100_000), account_type()
+        for _ in range(999_999):
+            source.transfer(destination, 0.1)
+        while destination.funds >= 0.1:
+            destination.transfer(source, 0.1)
+        print(f'{account_type.__name__:>22}: {source.funds!r} + {destination.funds!r} '
+              f'after 999,999 transfers of 0.10 and back')
+
+
+if __name__ == '__main__':
+    from bridge import BankingApplication
+
+    personal_account = CompactPersonalAccount(initial_funds=2000)
+    economies = CompactDepositAccount()
+    classic = DepositAccount()
+
+    app = BankingApplication()
+    app.add_account(personal_account)
+    app.add_account(economies)
+    app.add_account(classic)
+    app.set_current_account(personal_account)
+
+    app.make_credit(5000)
+    app.make_transfer(economies.iban, 1000.10)
+    app.make_transfer(classic.iban, 0.3)
+    app.make_transfers([personal_account], [economies], [500])
+    print('Interest accrued today:', app.accrue_interest())
+    app.list_accounts()
+
+    benchmark_compact()
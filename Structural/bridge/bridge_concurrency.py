@@ -0,0 +1,62 @@
+"""
+The banking application now serves many clients at the same time, so transfers
+run concurrently on a thread pool.
+
+Every account has its own lock and a transfer takes the locks of both accounts in
+a global order (see bridge.locked). This script stresses that: many threads move
+money around a small set of shared accounts, in both directions at once, and the
+total amount of money must be the same at the end.
+"""
+import concurrent.futures
+import random
+import time
+
+from bridge import (
+    AccountClosedError,
+    BankingApplication,
+    InsufficientFundsError,
+    PersonalAccount,
+)
+
+INITIAL_FUNDS = 1_000
+
+
+def _move_money(app: BankingApplication, transfers: int, seed: int) -> int:
+    rng = random.Random(seed)
+    accounts = list(app.accounts)
+    completed = 0
+    for _ in range(transfers):
+        source, destination = rng.sample(accounts, 2)
+        try:
+            source.transfer(destination, rng.randint(1, 50))
+            completed += 1
+        except (InsufficientFundsError, AccountClosedError):
+            pass
+
+    return completed
+
+
+def stress_test(threads: int, accounts: int, transfers_per_thread: int) -> float:
+    """Run the transfers on a thread pool and return the throughput in transfers/s."""
+    app = BankingApplication()
+    for _ in range(accounts):
+        app.add_account(PersonalAccount(initial_funds=INITIAL_FUNDS))
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        futures = [
+            pool.submit(_move_money, app, transfers_per_thread, seed)
+            for seed in range(threads)
+        ]
+        completed = sum(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+
+    total = sum(account.funds for account in app.accounts)
+    assert total == accounts * INITIAL_FUNDS, f'Money was lost or created: {total}'
+    return completed / elapsed
+
+
+if __name__ == '__main__':
+    for threads in (1, 4, 16, 64):
+        throughput = stress_test(threads, accounts=16, transfers_per_thread=10_000)
+        print(f'{threads:>3} threads: {throughput:10,.0f} transfers/s, total money conserved')
@@ -0,0 +1,384 @@
+"""
+The banking application keeps every balance in memory only, so a crash loses
+all the money of all the clients.
+
+Write every change to a local append-only journal before confirming it:
+- operations are applied in memory under the account locks and handed to the
+  journal while the locks are still held, so the journal order is the order in
+  which the changes were made
+- a single writer thread appends everything that was submitted since its last
+  write and fsyncs once for the whole group (group commit), then wakes up all
+  the callers waiting for their records
+- a snapshot of all the accounts can be taken at any time; on startup the state
+  is rebuilt from the latest snapshot and the journal records written after it
+"""
+import concurrent.futures
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import typing as t
+
+from bridge import (
+    Account,
+    AccountClosedError,
+    AccountRegistry,
+    BankingApplication,
+    DepositAccount,
+    InsufficientFundsError,
+    InterestAccrual,
+    PersonalAccount,
+    TransferBatchResult,
+    account_state,
+    accrue_interest,
+    locked,
+    restore_account,
+    skip_account_numbers,
+)
+
+
+class JournalClosedError(Exception):
+    pass
+
+
+class JournalCorruptedError(Exception):
+    pass
+
+
+class Journal:
+    """ Append-only file of JSON records, one per line, numbered from 1. """
+
+    def __init__(self, path: str, durable: bool = True, last_seq: int = 0):
+        self.path = path
+        self.durable = durable
+        self._file = open(path, 'ab')
+        self._condition = threading.Condition()
+        self._pending: t.List[bytes] = []
+        self._last_seq = last_seq
+        self._written_seq = last_seq
+        self._error: t.Optional[BaseException] = None
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_groups, daemon=True)
+        self._writer.start()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def submit(self, record: t.Dict[str, t.Any]) -> int:
+        """ Queue a record and return its sequence number without waiting for it. """
+        with self._condition:
+            if self._closed:
+                raise JournalClosedError('The journal is closed')
+
+            # Once a write failed, nothing queued after it can ever be written
+            if self._error:
+                raise JournalClosedError('The journal could not be written') from self._error
+
+            self._last_seq += 1
+            record['seq'] = self._last_seq
+            self._pending.append(json.dumps(record).encode() + b'\n')
+            self._condition.notify_all()
+            return self._last_seq
+
+    def wait(self, seq: int) -> None:
+        """ Block until the record seq and all the ones before it are written. """
+        with self._condition:
+            self._condition.wait_for(lambda: self._written_seq >= seq or self._error)
+            if self._written_seq < seq:
+                raise JournalClosedError('The journal could not be written') from self._error
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def _write_groups(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+
+                group, self._pending = self._pending, []
+                group_seq = self._last_seq
+
+            try:
+                self._file.write(b''.join(group))
+                self._file.flush()
+                if self.durable:
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self._written_seq = group_seq
+                self._condition.notify_all()
+
+
+def _apply(record: t.Dict[str, t.Any], accounts: AccountRegistry) -> None:
+    """ Redo a journaled operation. It succeeded once, so it succeeds again. """
+    operation = record['op']
+    if operation == 'open':
+        accounts.register(restore_account(record['account']))
+    elif operation == 'transfer':
+        source = accounts.get(record['source'])
+        source.transfer(accounts.get(record['destination']), record['amount'])
+    elif operation == 'transfers':
+        for iban, delta in record['deltas'].items():
+            accounts.get(iban).add_funds(delta)
+    elif operation == 'accrue':
+        accrue_interest(accounts, record['days_in_year'])
+    elif operation == 'borrow':
+        accounts.get(record['iban']).borrow(record['amount'])
+    elif operation == 'close':
+        accounts.get(record['iban']).close()
+    else:
+        raise ValueError(f'Unknown journal operation {operation!r}')
+
+
+def replay_journal(path: str, accounts: AccountRegistry, after_seq: int = 0) -> int:
+    """ Apply the records of the journal numbered after after_seq.
+
+    A crash can leave the last line half written: it was never confirmed to
+    anybody, so it is cut off the file. A bad line followed by other records is
+    not a crash but a damaged journal, and nothing is cut off. Returns the last
+    sequence number found.
+    """
+    last_seq = after_seq
+    valid_bytes = 0
+    if not os.path.exists(path):
+        return last_seq
+
+    with open(path, 'rb+') as journal:
+        for line in iter(journal.readline, b''):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict) or not line.endswith(b'\n'):
+                if journal.read(1):
+                    raise JournalCorruptedError(f'Bad record at byte {valid_bytes} of {path}')
+                break
+
+            valid_bytes += len(line)
+            if record['seq'] > after_seq:
+                _apply(record, accounts)
+            last_seq = max(last_seq, record['seq'])
+
+        journal.truncate(valid_bytes)
+
+    return last_seq
+
+
+class JournaledBankingApplication(BankingApplication):
+    """ A BankingApplication that confirms a change only once it is journaled. """
+
+    def __init__(self, journal: Journal):
+        super().__init__()
+        self.journal = journal
+        self._registry_lock = threading.Lock()
+
+    @classmethod
+    def open(
+            cls,
+            journal_path: str,
+            snapshot_path: t.Optional[str] = None,
+            durable: bool = True) -> 'JournaledBankingApplication':
+        """ Rebuild the application from the latest snapshot and the journal. """
+        accounts = AccountRegistry()
+        snapshot_seq = 0
+        if snapshot_path and os.path.exists(snapshot_path):
+            with open(snapshot_path) as snapshot:
+                state = json.load(snapshot)
+            accounts.register_many(restore_account(account) for account in state['accounts'])
+            snapshot_seq = state['seq']
+
+        last_seq = replay_journal(journal_path, accounts, snapshot_seq)
+        # New accounts must not reuse the IBANs of the restored ones
+        skip_account_numbers(account.iban for account in accounts)
+        app = cls(Journal(journal_path, durable, last_seq))
+        app.accounts = accounts
+        return app
+
+    def add_account(self, account: Account) -> None:
+        with self._registry_lock, account.lock:
+            super().add_account(account)
+            seq = self.journal.submit({'op': 'open', 'account': account_state(account)})
+        self.journal.wait(seq)
+
+    def add_accounts(self, accounts: t.Iterable[Account]) -> None:
+        for account in accounts:
+            self.add_account(account)
+
+    def transfer(
+            self,
+            source: t.Union[Account, str],
+            destination: t.Union[Account, str],
+            amount: float) -> None:
+        """ Move money between two managed accounts, without a current account. """
+        source, destination = self.get_account(source), self.get_account(destination)
+        with locked(source, destination):
+            source.transfer(destination, amount)
+            seq = self.journal.submit({
+                'op': 'transfer',
+                'source': source.iban,
+                'destination': destination.iban,
+                'amount': amount,
+            })
+        self.journal.wait(seq)
+
+    def make_transfer(self, destination_account: t.Union[Account, str], amount: float) -> None:
+        self.transfer(self.current_account, destination_account, amount)
+
+    def make_transfers(
+            self,
+            sources: t.Sequence[t.Union[Account, str]],
+            destinations: t.Sequence[t.Union[Account, str]],
+            amounts: t.Sequence[float]) -> TransferBatchResult:
+        """ Apply the batch, then journal the net change of every account it touched. """
+        # The registry stays locked, so the batch cannot reach an account opened meanwhile
+        with self._registry_lock:
+            accounts, _, _ = self.batch_accounts(sources, destinations)
+            with locked(*accounts):
+                funds = [account.funds for account in accounts]
+                result = super().make_transfers(sources, destinations, amounts)
+                deltas = {
+                    account.iban: account.funds - previous_funds
+                    for account, previous_funds in zip(accounts, funds)
+                    if account.funds != previous_funds
+                }
+                seq = self.journal.submit({'op': 'transfers', 'deltas': deltas})
+        self.journal.wait(seq)
+        return result
+
+    def accrue_interest(self, days_in_year: int = 365) -> InterestAccrual:
+        with self._registry_lock, locked(*self.accounts):
+            accrual = super().accrue_interest(days_in_year)
+            seq = self.journal.submit({'op': 'accrue', 'days_in_year': days_in_year})
+        self.journal.wait(seq)
+        return accrual
+
+    def credit(self, account: t.Union[Account, str], amount: float) -> None:
+        account = self.get_account(account)
+        if not isinstance(account, PersonalAccount):
+            return
+
+        with account.lock:
+            account.borrow(amount)
+            seq = self.journal.submit({'op': 'borrow', 'iban': account.iban, 'amount': amount})
+        self.journal.wait(seq)
+
+    def close(self) -> None:
+        account = self.current_account
+        with account.lock:
+            account.close()
+            seq = self.journal.submit({'op': 'close', 'iban': account.iban})
+        self.journal.wait(seq)
+
+    def snapshot(self, path: str) -> int:
+        """ Save the state of every account and return the last journal record it includes. """
+        with self._registry_lock, locked(*self.accounts):
+            # Every change made so far is in memory and was submitted to the journal
+            seq = self.journal.last_seq
+            state = {'seq': seq, 'accounts': [account_state(account) for account in self.accounts]}
+
+        # Only changes that were confirmed to their callers may end up in a snapshot
+        self.journal.wait(seq)
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as snapshot:
+            json.dump(state, snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary_path, path)
+        return seq
+
+    def shutdown(self) -> None:
+        self.journal.close()
+
+
+def _move_money(
+        transfer: t.Callable[[Account, Account, int], None],
+        accounts: t.List[Account],
+        transfers: int,
+        seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(transfers):
+        source, destination = rng.sample(accounts, 2)
+        try:
+            transfer(source, destination, rng.randint(1, 50))
+        except (InsufficientFundsError, AccountClosedError):
+            pass
+
+
+def benchmark_durability(threads: int, accounts: int = 64, transfers_per_thread: int = 500) -> None:
+    def in_memory_transfer(source: Account, destination: Account, amount: int) -> None:
+        source.transfer(destination, amount)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, durable in (('in memory', None), ('journal, no fsync', False), ('journal, fsync', True)):
+            if durable is None:
+                app = BankingApplication()
+                transfer = in_memory_transfer
+            else:
+                journal_path = os.path.join(directory, f'journal-{threads}-{durable}.log')
+                app = JournaledBankingApplication.open(journal_path, durable=durable)
+                transfer = app.transfer
+
+            for _ in range(accounts):
+                app.add_account(PersonalAccount(initial_funds=1_000))
+
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+                futures = [
+                    pool.submit(_move_money, transfer, list(app.accounts), transfers_per_thread, seed)
+                    for seed in range(threads)
+                ]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - start
+
+            if durable is not None:
+                app.shutdown()
+            print(f'{threads:>3} threads, {label:<17}: {threads * transfers_per_thread / elapsed:10,.0f} transfers/s')
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        journal_path = os.path.join(directory, 'bank.journal')
+        snapshot_path = os.path.join(directory, 'bank.snapshot')
+
+        app = JournaledBankingApplication.open(journal_path, snapshot_path)
+        personal_account = PersonalAccount(initial_funds=2000)
+        economies = DepositAccount()
+        app.add_account(personal_account)
+        app.add_account(economies)
+        app.set_current_account(personal_account)
+        app.make_credit(5000)
+        print('Snapshot taken after record', app.snapshot(snapshot_path))
+
+        app.make_transfer(economies.iban, 1000)
+        app.make_transfers([personal_account], [economies], [500])
+        app.accrue_interest()
+        app.list_accounts()
+
+        # Simulate a crash in the middle of writing a record
+        app.shutdown()
+        with open(journal_path, 'ab') as journal:
+            journal.write(b'{"op": "transfer", "sou')
+
+        recovered = JournaledBankingApplication.open(journal_path, snapshot_path)
+        print('Recovered after a crash:')
+        recovered.list_accounts()
+        print('Same balances:', [a.funds for a in recovered.accounts] == [a.funds for a in app.accounts])
+        recovered.shutdown()
+
+    for threads in (1, 16):
+        benchmark_durability(threads)
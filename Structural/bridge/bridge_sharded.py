@@ -0,0 +1,383 @@
+"""
+A single BankingApplication process only ever uses one core.
+
+Partition the accounts across worker processes instead, by a hash of their IBAN.
+Every shard is a process owning a regular BankingApplication, driven through a
+pipe by the coordinator:
+- a transfer between two accounts of the same shard is a single message
+- a transfer between shards uses a two-phase commit: both shards are asked to
+  prepare their half (the source puts the money on hold), and the transfer is
+  committed on both only if both agreed, otherwise it is aborted on both
+- the coordinator keeps the usual surface: add_account, set_current_account,
+  make_transfer, make_transfers, make_credit, list_accounts and close
+"""
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import threading
+import time
+import typing as t
+import zlib
+
+import bridge
+from bridge import (
+    Account,
+    AccountClosedError,
+    AccountState,
+    BankingApplication,
+    InsufficientFundsError,
+    PersonalAccount,
+    TransferBatchResult,
+    account_state,
+    is_whole_minor_units,
+    restore_account,
+)
+
+
+class ShardError(Exception):
+    pass
+
+
+class _Shard:
+    """ The state of one shard, inside its worker process. """
+
+    def __init__(self):
+        self.app = BankingApplication()
+        # txid -> (kind, iban, amount), kind being 'debit' or 'credit'
+        self.prepared: t.Dict[int, t.Tuple[str, str, float]] = {}
+
+    def open(self, state: t.Dict[str, t.Any]) -> None:
+        self.app.add_account(restore_account(state))
+
+    def transfer(self, source: str, destination: str, amount: float) -> None:
+        self.app.set_current_account(self.app.get_account(source))
+        self.app.make_transfer(destination, amount)
+
+    def transfers(
+            self,
+            sources: t.List[str],
+            destinations: t.List[str],
+            amounts: t.List[float]) -> TransferBatchResult:
+        return self.app.make_transfers(sources, destinations, amounts)
+
+    def prepare_debit(self, txid: int, iban: str, amount: float) -> None:
+        account = self.app.get_account(iban)
+        if account.funds < amount:
+            raise InsufficientFundsError('Not enough funds in the account')
+
+        if account.state == AccountState.CLOSED:
+            raise AccountClosedError('The account is not opened')
+
+        # The money is held right away, so no other transfer can spend it
+        account.add_funds(-amount)
+        self.prepared[txid] = ('debit', iban, amount)
+
+    def prepare_credit(self, txid: int, iban: str, amount: float) -> None:
+        self.app.get_account(iban)
+        self.prepared[txid] = ('credit', iban, amount)
+
+    def commit(self, txid: int) -> None:
+        kind, iban, amount = self.prepared.pop(txid)
+        # The debit already took the money when it was prepared
+        if kind == 'credit':
+            self.app.get_account(iban).add_funds(amount)
+
+    def abort(self, txid: int) -> None:
+        prepared = self.prepared.pop(txid, None)
+        if prepared and prepared[0] == 'debit':
+            _, iban, amount = prepared
+            self.app.get_account(iban).add_funds(amount)
+
+    def borrow(self, iban: str, amount: float) -> None:
+        account = self.app.get_account(iban)
+        # As in BankingApplication.credit, only personal accounts get credit
+        if isinstance(account, PersonalAccount):
+            account.borrow(amount)
+
+    def close(self, iban: str) -> None:
+        self.app.get_account(iban).close()
+
+    def display(self) -> t.List[str]:
+        return [account.display() for account in self.app.accounts]
+
+    def states(self) -> t.List[t.Dict[str, t.Any]]:
+        return [account_state(account) for account in self.app.accounts]
+
+
+def _serve_shard(connection: multiprocessing.connection.Connection) -> None:
+    """ Worker loop: run (operation, *args) messages until told to stop. """
+    shard = _Shard()
+    while True:
+        try:
+            operation, *args = connection.recv()
+        except EOFError:
+            return
+
+        if operation == 'stop':
+            return
+
+        try:
+            connection.send(('ok', getattr(shard, operation)(*args)))
+        except Exception as e:
+            connection.send(('error', type(e).__name__, str(e)))
+
+
+class ShardClient:
+    """ The coordinator's end of the pipe to one shard. """
+
+    def __init__(self, context: multiprocessing.context.BaseContext):
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_serve_shard, args=(worker_connection,), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        # Requests and replies of concurrent callers must not interleave
+        self.lock = threading.Lock()
+
+    def call(self, operation: str, *args: t.Any) -> t.Any:
+        with self.lock:
+            self.connection.send((operation, *args))
+            return self._unwrap(self.connection.recv())
+
+    def send(self, operation: str, *args: t.Any) -> None:
+        """ Start a request without waiting for it; the caller holds the lock. """
+        self.connection.send((operation, *args))
+
+    def receive(self) -> t.Any:
+        return self._unwrap(self.connection.recv())
+
+    def close(self) -> None:
+        # Closing the pipe is not enough: forked shards inherit each other's ends
+        with self.lock:
+            self.connection.send(('stop',))
+        self.connection.close()
+        self.process.join()
+
+    @staticmethod
+    def _unwrap(reply: t.Tuple) -> t.Any:
+        if reply[0] == 'ok':
+            return reply[1]
+
+        _, name, message = reply
+        # Errors of the banking domain are raised again as themselves
+        error = getattr(bridge, name, None)
+        if not (isinstance(error, type) and issubclass(error, Exception)):
+            error = ShardError
+        raise error(message)
+
+
+class ShardedBankingApplication:
+    def __init__(self, shards: int = os.cpu_count() or 1):
+        context = multiprocessing.get_context()
+        self.shards = [ShardClient(context) for _ in range(shards)]
+        self.current_account: t.Optional[str] = None
+        self._txids = itertools.count(1)
+        self._txid_lock = threading.Lock()
+
+    def __enter__(self) -> 'ShardedBankingApplication':
+        return self
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+    def shard_of(self, iban: str) -> ShardClient:
+        # crc32 rather than hash(): str hashes change from one process to another
+        return self.shards[zlib.crc32(iban.encode()) % len(self.shards)]
+
+    def add_account(self, account: Account) -> None:
+        self.shard_of(account.iban).call('open', account_state(account))
+
+    def set_current_account(self, account: t.Union[Account, str]) -> None:
+        self.current_account = account if isinstance(account, str) else account.iban
+
+    def list_accounts(self) -> None:
+        for shard in self.shards:
+            for display in shard.call('display'):
+                print(display)
+                print('-' * 50)
+
+    def make_transfer(self, destination_account: t.Union[Account, str], amount: float) -> None:
+        self.transfer(self.current_account, destination_account, amount)
+
+    def transfer(
+            self,
+            source: t.Union[Account, str],
+            destination: t.Union[Account, str],
+            amount: float) -> None:
+        if amount <= 0:
+            raise ValueError('The amount must be positive')
+
+        source = source if isinstance(source, str) else source.iban
+        destination = destination if isinstance(destination, str) else destination.iban
+        source_shard, destination_shard = self.shard_of(source), self.shard_of(destination)
+        if source_shard is destination_shard:
+            source_shard.call('transfer', source, destination, amount)
+            return
+
+        with self._txid_lock:
+            txid = next(self._txids)
+
+        # Phase one: both shards must agree, a refusal aborts the transfer on both
+        try:
+            source_shard.call('prepare_debit', txid, source, amount)
+        except Exception:
+            source_shard.call('abort', txid)
+            raise
+
+        try:
+            destination_shard.call('prepare_credit', txid, destination, amount)
+        except Exception:
+            destination_shard.call('abort', txid)
+            source_shard.call('abort', txid)
+            raise
+
+        # Phase two
+        source_shard.call('commit', txid)
+        destination_shard.call('commit', txid)
+
+    def make_transfers(
+            self,
+            sources: t.Sequence[t.Union[Account, str]],
+            destinations: t.Sequence[t.Union[Account, str]],
+            amounts: t.Sequence[float]) -> TransferBatchResult:
+        """ Apply many transfers at once.
+
+        The rows that stay inside a shard are sent to all the shards at the same
+        time and applied there as one batch each (see BankingApplication.make_transfers),
+        so the shards work in parallel. The rows crossing shards follow, one
+        two-phase commit each.
+        """
+        if not len(sources) == len(destinations) == len(amounts):
+            raise ValueError('A batch needs as many sources, destinations and amounts')
+
+        local_rows: t.Dict[int, t.List[int]] = {}
+        cross_rows = []
+        sources = [source if isinstance(source, str) else source.iban for source in sources]
+        destinations = [
+            destination if isinstance(destination, str) else destination.iban
+            for destination in destinations
+        ]
+        shard_numbers = {id(shard): number for number, shard in enumerate(self.shards)}
+        for row, (source, destination) in enumerate(zip(sources, destinations)):
+            source_shard = self.shard_of(source)
+            if source_shard is self.shard_of(destination):
+                local_rows.setdefault(shard_numbers[id(source_shard)], []).append(row)
+            else:
+                cross_rows.append(row)
+
+        applied = 0
+        rejected = []
+        shards = [self.shards[number] for number in local_rows]
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            for number, rows in local_rows.items():
+                self.shards[number].send(
+                    'transfers',
+                    [sources[row] for row in rows],
+                    [destinations[row] for row in rows],
+                    [amounts[row] for row in rows])
+            for number, rows in local_rows.items():
+                result = self.shards[number].receive()
+                applied += result.applied
+                rejected.extend((rows[row], reason) for row, reason in result.rejected)
+        finally:
+            for shard in shards:
+                shard.lock.release()
+
+        for row in cross_rows:
+            if amounts[row] <= 0:
+                rejected.append((row, 'The amount must be positive'))
+                continue
+
+            if not is_whole_minor_units(amounts[row]):
+                rejected.append((row, 'The amount must be a whole number of cents'))
+                continue
+
+            try:
+                self.transfer(sources[row], destinations[row], amounts[row])
+                applied += 1
+            except (InsufficientFundsError, AccountClosedError, bridge.UnknownAccountError) as e:
+                rejected.append((row, str(e)))
+
+        return TransferBatchResult(applied, sorted(rejected))
+
+    def credit(self, account: t.Union[Account, str], amount: float) -> None:
+        iban = account if isinstance(account, str) else account.iban
+        self.shard_of(iban).call('borrow', iban, amount)
+
+    def make_credit(self, amount: float) -> None:
+        self.credit(self.current_account, amount)
+
+    def close(self) -> None:
+        self.shard_of(self.current_account).call('close', self.current_account)
+
+    def total_funds(self) -> float:
+        return sum(state['funds'] for shard in self.shards for state in shard.call('states'))
+
+
+def benchmark_scaling(
+        accounts_per_shard: int = 1_000,
+        transfers_per_shard: int = 100_000,
+        cross_shard_ratio: float = 0.01) -> None:
+    """ Transfers/s as the number of shards grows, with the work per shard fixed. """
+    baseline = None
+    for shards in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with ShardedBankingApplication(shards) as app:
+            by_shard: t.List[t.List[str]] = [[] for _ in range(shards)]
+            while min(map(len, by_shard)) < accounts_per_shard:
+                account = PersonalAccount(initial_funds=1_000)
+                shard_accounts = by_shard[app.shards.index(app.shard_of(account.iban))]
+                if len(shard_accounts) < accounts_per_shard:
+                    app.add_account(account)
+                    shard_accounts.append(account.iban)
+
+            rng = random.Random(0)
+            sources, destinations = [], []
+            for _ in range(shards * transfers_per_shard):
+                source_accounts = rng.choice(by_shard)
+                destination_accounts = source_accounts
+                if shards > 1 and rng.random() < cross_shard_ratio:
+                    destination_accounts = rng.choice(by_shard)
+                sources.append(rng.choice(source_accounts))
+                destinations.append(rng.choice(destination_accounts))
+            amounts = [rng.randint(1, 100) for _ in sources]
+
+            start = time.perf_counter()
+            result = app.make_transfers(sources, destinations, amounts)
+            elapsed = time.perf_counter() - start
+
+            total = app.total_funds()
+            assert total == shards * accounts_per_shard * 1_000, f'Money was lost or created: {total}'
+
+        throughput = len(amounts) / elapsed
+        baseline = baseline or throughput
+        print(f'{shards:>3} shards: {throughput:10,.0f} transfers/s (x{throughput / baseline:.1f}), '
+              f'{result.applied} applied')
+
+
+if __name__ == '__main__':
+    personal_account = PersonalAccount(initial_funds=2000)
+    economies = bridge.DepositAccount()
+
+    with ShardedBankingApplication(shards=2) as app:
+        app.add_account(personal_account)
+        app.add_account(economies)
+        app.set_current_account(personal_account)
+
+        app.make_credit(5000)
+        app.make_transfer(economies.iban, 1000)
+
+        try:
+            app.make_transfer(economies.iban, 1_000_000)
+        except InsufficientFundsError as e:
+            print('Transfer refused:', e)
+
+        app.list_accounts()
+
+    benchmark_scaling()
@@ -0,0 +1,214 @@
+"""
+Statements are built with list_accounts, which calls display() and prints the
+accounts one at a time: slow for a large customer base, and impossible to page.
+
+Render them from a materialized snapshot of the balances instead:
+- a BalanceSnapshot copies the balances of all the accounts into columns at
+  once, and indexes the rows by account type and state
+- a SnapshotRefresher takes a new snapshot periodically on a background thread,
+  readers keep using the previous one until the new one is ready
+- render_statements streams a page of (filtered) statements from a snapshot to
+  any file-like sink, in large chunks instead of one write per account
+"""
+import array
+import contextlib
+import io
+import operator
+import os
+import sys
+import threading
+import time
+import typing as t
+
+from bridge import (
+    Account,
+    AccountState,
+    BankingApplication,
+    DepositAccount,
+    PersonalAccount,
+    locked,
+)
+
+PERSONAL = 0
+DEPOSIT = 1
+
+SEPARATOR = '-' * 50
+TEMPLATES = {
+    PERSONAL: 'Acc. Type: {}\nAcc. State: {}\nBalance: {:.2f}\nDebt: {:.2f}\n' + SEPARATOR + '\n',
+    DEPOSIT: 'Acc. Type: {}\nAcc. State: {}\nBalance: {:.2f}\nInterest rate: {:.3f}\n' + SEPARATOR + '\n',
+}
+
+
+class BalanceSnapshot:
+    """ The balances of all the accounts of an application at one point in time. """
+
+    def __init__(self, app: BankingApplication):
+        with locked(*app.accounts):
+            accounts = list(app.accounts)
+            self.taken_at = time.time()
+            self.ibans = [account.iban for account in accounts]
+            self.types = [type(account) for account in accounts]
+            self.states = [account.state for account in accounts]
+            self.balances = array.array('d', map(operator.methodcaller('balance'), accounts))
+            self.kinds = array.array('B', (
+                PERSONAL if isinstance(account, PersonalAccount) else DEPOSIT
+                for account in accounts
+            ))
+            # Debt of personal accounts, interest rate of deposit accounts
+            self.details = array.array('d', (
+                account.debt if isinstance(account, PersonalAccount) else account.interest
+                for account in accounts
+            ))
+
+        self._rows_by_group: t.Dict[t.Tuple[type, AccountState], array.array] = {}
+        for row, group in enumerate(zip(self.types, self.states)):
+            rows = self._rows_by_group.get(group)
+            if rows is None:
+                rows = self._rows_by_group[group] = array.array('I')
+            rows.append(row)
+
+    def __len__(self) -> int:
+        return len(self.ibans)
+
+    def rows(
+            self,
+            account_type: t.Optional[t.Type[Account]] = None,
+            state: t.Optional[AccountState] = None) -> t.Sequence[int]:
+        """ The rows matching the filters, in the order of the application. """
+        if account_type is None and state is None:
+            return range(len(self))
+
+        groups = [
+            rows for (group_type, group_state), rows in self._rows_by_group.items()
+            if (account_type is None or issubclass(group_type, account_type))
+            and (state is None or group_state == state)
+        ]
+        if len(groups) == 1:
+            return groups[0]
+
+        return sorted(row for rows in groups for row in rows)
+
+
+class SnapshotRefresher:
+    """ Keeps a fresh BalanceSnapshot of an application, taken every `interval` seconds. """
+
+    def __init__(self, app: BankingApplication, interval: float = 60.0):
+        self.app = app
+        self.interval = interval
+        self.snapshot = BalanceSnapshot(app)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._refresh_periodically, daemon=True)
+
+    def __enter__(self) -> 'SnapshotRefresher':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def refresh(self) -> BalanceSnapshot:
+        # Readers holding the previous snapshot keep a consistent view of it
+        self.snapshot = BalanceSnapshot(self.app)
+        return self.snapshot
+
+    def _refresh_periodically(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.refresh()
+
+
+def render_statements(
+        snapshot: BalanceSnapshot,
+        sink: t.TextIO,
+        account_type: t.Optional[t.Type[Account]] = None,
+        state: t.Optional[AccountState] = None,
+        page: int = 0,
+        page_size: t.Optional[int] = None,
+        chunk_size: int = 1 << 16) -> int:
+    """ Write the statements of one page of accounts to sink and return how many were written.
+
+    Pages are numbered from 0. Without a page_size, every matching account is written.
+    """
+    rows = snapshot.rows(account_type, state)
+    if page_size is not None:
+        rows = rows[page * page_size:(page + 1) * page_size]
+
+    types, states, balances, kinds, details = (
+        snapshot.types, snapshot.states, snapshot.balances, snapshot.kinds, snapshot.details)
+    chunk = []
+    chunk_length = 0
+    for row in rows:
+        text = TEMPLATES[kinds[row]].format(
+            types[row].__name__, states[row].name, balances[row], details[row])
+        chunk.append(text)
+        chunk_length += len(text)
+        if chunk_length >= chunk_size:
+            sink.write(''.join(chunk))
+            chunk.clear()
+            chunk_length = 0
+
+    if chunk:
+        sink.write(''.join(chunk))
+
+    return len(rows)
+
+
+def benchmark_statements(accounts: int = 200_000) -> None:
+    app = BankingApplication()
+    for number in range(accounts):
+        app.add_account(PersonalAccount(initial_funds=number) if number % 2 else DepositAccount())
+
+    with open(os.devnull, 'w') as devnull:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(devnull):
+            app.list_accounts()
+        list_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        snapshot = BalanceSnapshot(app)
+        snapshot_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_statements(snapshot, devnull)
+        render_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_statements(snapshot, devnull, DepositAccount, AccountState.OPENED, page=50, page_size=100)
+        page_elapsed = time.perf_counter() - start
+
+    print(f'{accounts:,} accounts: list_accounts {list_elapsed:.2f}s, '
+          f'snapshot {snapshot_elapsed:.2f}s, render all {render_elapsed:.2f}s, '
+          f'one filtered page {page_elapsed * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    personal_account = PersonalAccount(initial_funds=2000)
+    economies = DepositAccount()
+    closed = DepositAccount()
+
+    app = BankingApplication()
+    app.add_account(personal_account)
+    app.add_account(economies)
+    app.add_account(closed)
+    app.set_current_account(closed)
+    app.close()
+
+    with SnapshotRefresher(app, interval=0.1) as refresher:
+        app.set_current_account(personal_account)
+        app.make_transfer(economies, 1000)
+        print('Before the refresh:')
+        render_statements(refresher.snapshot, sys.stdout, DepositAccount, AccountState.OPENED)
+        time.sleep(0.2)
+
+        statements = io.StringIO()
+        written = render_statements(refresher.snapshot, statements, page=0, page_size=2)
+        print(f'After the refresh, first page ({written} accounts):')
+        print(statements.getvalue(), end='')
+
+    benchmark_statements()
@@ -0,0 +1,292 @@
+"""
+The cloud storage system became popular and some trees now hold millions of items.
+Keeping a full Python object (with its own __dict__ and children list) for every
+file and folder costs gigabytes of memory.
+
+Store the same structure as a struct-of-arrays instead:
+- one typed array per attribute (parent id, size, interned name id, kind, ...)
+- lightweight File/Folder views that expose the usual Item API on top of the arrays
+- a report of the memory used per node compared to the object-based tree
+"""
+
+import array
+import contextlib
+import os
+import tracemalloc
+import typing as t
+
+from composite_with_path import File, Folder, Item
+
+NO_NODE = -1
+FILE = 0
+FOLDER = 1
+
+
+class CompactTree:
+    """All the nodes of a tree stored column by column.
+
+    Node ids are positions in the arrays and the root is always node 0.
+    Children are chained through first_child/next_sibling so appending one is O(1).
+    Folder sizes are aggregated along the parent chain like in composite_with_path.
+    """
+
+    def __init__(self, root_name: str = "root"):
+        self.parents = array.array("i")
+        self.sizes = array.array("q")
+        self.name_ids = array.array("I")
+        self.kinds = array.array("B")
+        self.first_child = array.array("i")
+        self.last_child = array.array("i")
+        self.next_sibling = array.array("i")
+        self.names: t.List[str] = []
+        self._name_ids: t.Dict[str, int] = {}
+
+        self._add_node(root_name, NO_NODE, FOLDER, 0)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    @property
+    def root(self) -> "CompactFolder":
+        return CompactFolder(self, 0)
+
+    def add_file(self, parent_id: int, name: str, size: int) -> int:
+        node_id = self._add_node(name, parent_id, FILE, size)
+        self.update_size(parent_id, size)
+        return node_id
+
+    def add_folder(self, parent_id: int, name: str) -> int:
+        return self._add_node(name, parent_id, FOLDER, 0)
+
+    def update_size(self, node_id: int, delta: int) -> None:
+        sizes = self.sizes
+        parents = self.parents
+        while node_id != NO_NODE:
+            sizes[node_id] += delta
+            node_id = parents[node_id]
+
+    def intern(self, name: str) -> int:
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+
+        return name_id
+
+    def view(self, node_id: int) -> "CompactItem":
+        if self.kinds[node_id] == FOLDER:
+            return CompactFolder(self, node_id)
+
+        return CompactFile(self, node_id)
+
+    def iter_children(self, node_id: int) -> t.Iterator[int]:
+        child = self.first_child[node_id]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def is_within(self, node_id: int, ancestor_id: int) -> bool:
+        parents = self.parents
+        while node_id != NO_NODE:
+            if node_id == ancestor_id:
+                return True
+
+            node_id = parents[node_id]
+
+        return False
+
+    def nbytes(self) -> int:
+        """Memory used by the columns and the (shared) name table."""
+        columns = (
+            self.parents,
+            self.sizes,
+            self.name_ids,
+            self.kinds,
+            self.first_child,
+            self.last_child,
+            self.next_sibling,
+        )
+        total = sum(column.buffer_info()[1] * column.itemsize for column in columns)
+        return total + sum(len(name) for name in self.names)
+
+    def _add_node(self, name: str, parent_id: int, kind: int, size: int) -> int:
+        node_id = len(self.parents)
+        self.parents.append(parent_id)
+        self.sizes.append(size)
+        self.name_ids.append(self.intern(name))
+        self.kinds.append(kind)
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+
+        if parent_id != NO_NODE:
+            if self.first_child[parent_id] == NO_NODE:
+                self.first_child[parent_id] = node_id
+            else:
+                self.next_sibling[self.last_child[parent_id]] = node_id
+
+            self.last_child[parent_id] = node_id
+
+        return node_id
+
+    @classmethod
+    def from_items(cls, root: Folder) -> "CompactTree":
+        tree = cls(root.name)
+        stack = [(root, 0)]
+        while stack:
+            folder, folder_id = stack.pop()
+            for child in folder.list_content():
+                if isinstance(child, Folder):
+                    stack.append((child, tree.add_folder(folder_id, child.name)))
+                else:
+                    tree.add_file(folder_id, child.name, child.get_size())
+
+        return tree
+
+
+class CompactItem(Item):
+    """A view over one node of a CompactTree. Views are cheap and created on demand."""
+
+    __slots__ = ("tree", "node_id")
+
+    def __init__(self, tree: CompactTree, node_id: int):
+        self.tree = tree
+        self.node_id = node_id
+
+    @property
+    def name(self) -> str:
+        return self.tree.names[self.tree.name_ids[self.node_id]]
+
+    @property
+    def parent(self) -> t.Optional["CompactFolder"]:
+        parent_id = self.tree.parents[self.node_id]
+        if parent_id == NO_NODE:
+            return None
+
+        return CompactFolder(self.tree, parent_id)
+
+    def get_size(self) -> int:
+        return self.tree.sizes[self.node_id]
+
+    def get_path(self) -> str:
+        names = []
+        node_id = self.node_id
+        while node_id != NO_NODE:
+            names.append(self.tree.names[self.tree.name_ids[node_id]])
+            node_id = self.tree.parents[node_id]
+
+        return os.path.join(*reversed(names))
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, CompactItem)
+            and self.tree is other.tree
+            and self.node_id == other.node_id
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.node_id))
+
+
+class CompactFile(CompactItem):
+    __slots__ = ()
+
+    def search(self, name: str) -> t.List[Item]:
+        return [self] if self.name == name else []
+
+    def __repr__(self) -> str:
+        return f"File({self.name})"
+
+
+class CompactFolder(CompactItem):
+    __slots__ = ()
+
+    def add_file(self, name: str, size: int) -> CompactFile:
+        return CompactFile(self.tree, self.tree.add_file(self.node_id, name, size))
+
+    def add_folder(self, name: str) -> "CompactFolder":
+        return CompactFolder(self.tree, self.tree.add_folder(self.node_id, name))
+
+    def list_content(self) -> t.List[Item]:
+        return list(self.iter_children())
+
+    def iter_children(self) -> t.Iterator[Item]:
+        return (
+            self.tree.view(child) for child in self.tree.iter_children(self.node_id)
+        )
+
+    def search(self, name: str) -> t.List[Item]:
+        tree = self.tree
+        name_id = tree._name_ids.get(name)
+        if name_id is None:
+            return []
+
+        # array.index scans the column in C, we only pay Python time per match
+        results = []
+        name_ids = tree.name_ids
+        position = 0
+        while True:
+            try:
+                position = name_ids.index(name_id, position)
+            except ValueError:
+                return results
+
+            if tree.is_within(position, self.node_id):
+                results.append(tree.view(position))
+
+            position += 1
+
+    def __repr__(self) -> str:
+        return f"Folder({self.name})"
+
+
+def measure_bytes_per_node(folders: int = 200, files_per_folder: int = 500) -> None:
+    nodes = 1 + folders + folders * files_per_folder
+
+    tracemalloc.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        root = Folder("root")
+        for folder_number in range(folders):
+            folder = Folder(f"folder{folder_number}")
+            root.add(folder)
+            for file_number in range(files_per_folder):
+                folder.add(File(f"file{file_number}", size=file_number))
+    objects_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del root
+
+    tracemalloc.start()
+    tree = CompactTree("root")
+    for folder_number in range(folders):
+        folder_id = tree.add_folder(0, f"folder{folder_number}")
+        for file_number in range(files_per_folder):
+            tree.add_file(folder_id, f"file{file_number}", file_number)
+    compact_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Nodes: {nodes}")
+    print(f"Object tree:  {objects_bytes / nodes:8.1f} bytes/node")
+    print(f"Compact tree: {compact_bytes / nodes:8.1f} bytes/node")
+    print(f"Compact columns only: {tree.nbytes() / nodes:.1f} bytes/node")
+
+
+if __name__ == "__main__":
+    tree = CompactTree("root")
+    root = tree.root
+    folder1 = root.add_folder("folder1")
+    folder2 = root.add_folder("folder2")
+    folder21 = folder2.add_folder("folder21")
+    folder1.add_file("file11", size=10)
+    folder2.add_file("file21", size=20)
+    folder21.add_file("file22", size=30)
+    root.add_file("file01", size=40)
+    root.add_file("file02", size=50)
+
+    print("root.get_size", root.get_size())
+    print("root content:", root.list_content())
+    file22 = root.search("file22")[0]
+    print("file22 path:", file22.get_path())
+    print("Size of folder21:", folder21.get_size())
+    print("file11 inside folder2:", folder2.search("file11"))
+
+    measure_bytes_per_node()
@@ -0,0 +1,255 @@
+"""
+Some customers own namespaces far too large to ever hold in memory, but users only
+browse a small part of them at a time.
+
+Build a folder that loads its children on first access from a storage backend:
+- the backends are pluggable: a local directory and an SQLite database are provided
+- the loaded folders are kept in a bounded LRU, older ones drop their children
+  and reload them from the backend when accessed again
+- get_size, search and get_path keep working as with a regular Folder
+"""
+
+import abc
+import collections
+import os
+import sqlite3
+import typing as t
+
+from composite_with_path import File, Folder, Item
+
+
+class Entry(t.NamedTuple):
+    name: str
+    is_folder: bool
+    size: t.Optional[int]  # None when the backend cannot tell cheaply
+
+
+class StorageBackend(abc.ABC):
+    """Paths given to a backend are relative to its root ("" is the root itself)."""
+
+    @abc.abstractmethod
+    def list_entries(self, path: str) -> t.Iterable[Entry]:
+        pass
+
+    @abc.abstractmethod
+    def folder_size(self, path: str) -> int:
+        pass
+
+
+class LocalDirectoryBackend(StorageBackend):
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+
+    def list_entries(self, path: str) -> t.Iterable[Entry]:
+        with os.scandir(os.path.join(self.directory, path)) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield Entry(entry.name, True, None)
+                else:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    yield Entry(entry.name, False, size)
+
+    def folder_size(self, path: str) -> int:
+        size = 0
+        stack = [os.path.join(self.directory, path)]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_size
+
+        return size
+
+
+class SQLiteBackend(StorageBackend):
+    """Items stored one row each, folders carry the total size of their content."""
+
+    def __init__(self, database: str = ":memory:"):
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                name TEXT NOT NULL,
+                is_folder INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS items_parent ON items (parent);
+            """)
+
+    def import_tree(self, root: Folder) -> None:
+        """Store every item under root, with paths relative to root."""
+        rows = []
+        for item in root.walk():
+            if item is root:
+                continue
+
+            path = os.path.relpath(item.get_path(), root.get_path())
+            parent = os.path.dirname(path)
+            is_folder = isinstance(item, Folder)
+            rows.append((path, parent, item.name, is_folder, item.get_size()))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def list_entries(self, path: str) -> t.Iterable[Entry]:
+        rows = self.connection.execute(
+            "SELECT name, is_folder, size FROM items WHERE parent = ?", (path,)
+        )
+        return [Entry(name, bool(is_folder), size) for name, is_folder, size in rows]
+
+    def folder_size(self, path: str) -> int:
+        if not path:
+            row = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM items WHERE parent = ''"
+            ).fetchone()
+        else:
+            row = self.connection.execute(
+                "SELECT size FROM items WHERE path = ?", (path,)
+            ).fetchone()
+
+        return row[0] if row else 0
+
+
+class LoadedFolderCache:
+    """LRU of the folders whose children are currently in memory."""
+
+    def __init__(self, max_folders: int):
+        self.max_folders = max_folders
+        self._folders: t.OrderedDict["LazyFolder", None] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._folders)
+
+    def touch(self, folder: "LazyFolder") -> None:
+        if folder in self._folders:
+            self._folders.move_to_end(folder)
+            return
+
+        self._folders[folder] = None
+        while len(self._folders) > self.max_folders:
+            evicted, _ = self._folders.popitem(last=False)
+            evicted._unload()
+
+    def discard(self, folder: "LazyFolder") -> None:
+        self._folders.pop(folder, None)
+
+
+class LazyFolder(Item):
+    def __init__(
+        self,
+        name: str,
+        backend: StorageBackend,
+        cache: LoadedFolderCache,
+        parent: t.Optional["LazyFolder"] = None,
+        size: t.Optional[int] = None,
+    ):
+        self.name = name
+        self.backend = backend
+        self.cache = cache
+        self.parent = parent
+        self._size = size
+        self._children: t.Optional[t.Dict[str, Item]] = None
+        if parent:
+            self._backend_path = os.path.join(parent._backend_path, name)
+            self._path = os.path.join(parent.get_path(), name)
+        else:
+            self._backend_path = ""
+            self._path = name
+
+    @property
+    def loaded(self) -> bool:
+        return self._children is not None
+
+    def iter_children(self) -> t.List[Item]:
+        if self._children is None:
+            self._load()
+
+        # Read before touching: the touch may evict an ancestor, and this folder with it
+        children = list(self._children.values())
+        self.cache.touch(self)
+        # A copy, so evicting this folder while iterating is harmless
+        return children
+
+    def list_content(self) -> t.List[Item]:
+        return self.iter_children()
+
+    def get_child(self, name: str) -> t.Optional[Item]:
+        if self._children is None:
+            self._load()
+
+        child = self._children.get(name)
+        self.cache.touch(self)
+        return child
+
+    def get_size(self) -> int:
+        if self._size is None:
+            self._size = self.backend.folder_size(self._backend_path)
+
+        return self._size
+
+    def search(self, name: str) -> t.List[Item]:
+        return list(self.iter_search(name))
+
+    def get_path(self) -> str:
+        return self._path
+
+    def _load(self) -> None:
+        children = {}
+        for entry in self.backend.list_entries(self._backend_path):
+            if entry.is_folder:
+                child = LazyFolder(
+                    entry.name, self.backend, self.cache, self, size=entry.size
+                )
+            else:
+                child = File(entry.name, size=entry.size, parent=self)
+
+            children[entry.name] = child
+
+        self._children = children
+
+    def _unload(self) -> None:
+        """Drop the children, and unload the loaded folders among their descendants.
+
+        A reload builds new child objects, so the old ones would only use up the cache.
+        """
+        stack = [self]
+        while stack:
+            folder = stack.pop()
+            children, folder._children = folder._children, None
+            for child in (children or {}).values():
+                if isinstance(child, LazyFolder) and child.loaded:
+                    self.cache.discard(child)
+                    stack.append(child)
+
+    def __repr__(self) -> str:
+        return f"Folder({self.name})"
+
+
+def open_lazy_root(
+    name: str, backend: StorageBackend, max_loaded_folders: int = 1_000
+) -> LazyFolder:
+    return LazyFolder(name, backend, LoadedFolderCache(max_loaded_folders))
+
+
+if __name__ == "__main__":
+    from composite_with_path import load_structure
+
+    backend = SQLiteBackend()
+    backend.import_tree(load_structure())
+    root = open_lazy_root("root", backend, max_loaded_folders=2)
+
+    print("root.get_size", root.get_size())
+    print("root content:", root.list_content())
+    file22 = root.search("file22")[0]
+    print("file22 path:", file22.get_path())
+    print("Loaded folders:", len(root.cache), "(capped at 2)")
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    local_root = open_lazy_root("composite", LocalDirectoryBackend(directory))
+    print("Local directory size:", local_root.get_size())
+    print("Local directory content:", local_root.list_content())
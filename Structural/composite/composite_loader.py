@@ -0,0 +1,164 @@
+"""
+Customers want to migrate their existing inventories into the cloud storage system.
+Building the tree by hand (or item by item through Folder.add, which logs every
+item it creates) is far too slow for real inventories.
+
+Load the structure in bulk, in a single streaming pass, from:
+- a JSONL manifest, one {"path": ..., "size": ..., "type": "file" | "folder"} per line
+- a CSV manifest with the path,size,type columns
+- a local directory, scanned with os.scandir
+
+Files are attached to their folders in batches and nothing is logged per item.
+"""
+
+import csv
+import json
+import os
+import tempfile
+import time
+import typing as t
+
+from composite_with_path import File, Folder
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+class TreeLoader:
+    """Builds a tree from (path, size, is_folder) entries.
+
+    Paths are relative to the root. Missing parent folders are created on the fly.
+    """
+
+    def __init__(self, root_name: str = "root", batch_size: int = DEFAULT_BATCH_SIZE):
+        self.root = Folder(root_name)
+        self.batch_size = batch_size
+        self._pending: t.Dict[Folder, t.List[File]] = {}
+        self._pending_count = 0
+        # Manifests are usually grouped by folder, so remember the last one
+        self._last_folder_path = ""
+        self._last_folder = self.root
+
+    def add_entry(self, path: str, size: int = 0, is_folder: bool = False) -> None:
+        parent_path, _, name = path.rstrip(os.sep).rpartition(os.sep)
+        parent = self._get_folder(parent_path)
+        if is_folder:
+            if self.root.resolve(os.path.join(parent.get_path(), name)) is None:
+                parent.add_many([Folder(name)])
+            return
+
+        pending = self._pending.get(parent)
+        if pending is None:
+            pending = self._pending[parent] = []
+
+        pending.append(File(name, size=size))
+        self._pending_count += 1
+        if self._pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for folder, files in self._pending.items():
+            folder.add_many(files)
+
+        self._pending.clear()
+        self._pending_count = 0
+
+    def finish(self) -> Folder:
+        self.flush()
+        return self.root
+
+    def _get_folder(self, path: str) -> Folder:
+        if path == self._last_folder_path:
+            return self._last_folder
+
+        folder = self.root
+        if path:
+            folder = self.root.resolve(os.path.join(self.root.name, path))
+            if folder is None:
+                folder = self._create_folders(path)
+
+        self._last_folder_path = path
+        self._last_folder = folder
+        return folder
+
+    def _create_folders(self, path: str) -> Folder:
+        folder = self.root
+        for name in path.split(os.sep):
+            child = self.root.resolve(os.path.join(folder.get_path(), name))
+            if child is None:
+                child = Folder(name)
+                folder.add_many([child])
+
+            folder = child
+
+        return folder
+
+
+def load_manifest(
+    path: str, root_name: str = "root", batch_size: int = DEFAULT_BATCH_SIZE
+) -> Folder:
+    """Stream a .jsonl or .csv manifest into a new tree."""
+    loader = TreeLoader(root_name, batch_size)
+    with open(path, newline="") as manifest:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(manifest)
+        else:
+            decode = json.JSONDecoder().decode
+            rows = (decode(line) for line in manifest if not line.isspace())
+
+        for row in rows:
+            loader.add_entry(
+                row["path"],
+                size=int(row.get("size") or 0),
+                is_folder=row.get("type") == "folder",
+            )
+
+    return loader.finish()
+
+
+def load_directory(path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Folder:
+    """Scan a local directory into a new tree, without following symlinks."""
+    path = os.path.abspath(path)
+    loader = TreeLoader(os.path.basename(path) or path, batch_size)
+    stack = [("", path)]
+    while stack:
+        relative_path, directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                entry_path = os.path.join(relative_path, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    loader.add_entry(entry_path, is_folder=True)
+                    stack.append((entry_path, entry.path))
+                else:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    loader.add_entry(entry_path, size=size)
+
+    return loader.finish()
+
+
+def write_synthetic_manifest(path: str, folders: int, files_per_folder: int) -> None:
+    with open(path, "w") as manifest:
+        for folder_number in range(folders):
+            for file_number in range(files_per_folder):
+                entry = {
+                    "path": f"folder{folder_number}/file{file_number}",
+                    "size": file_number,
+                }
+                manifest.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        manifest_path = os.path.join(directory, "manifest.jsonl")
+        write_synthetic_manifest(manifest_path, folders=1_000, files_per_folder=1_000)
+
+        start = time.perf_counter()
+        root = load_manifest(manifest_path)
+        elapsed = time.perf_counter() - start
+
+    print(f"Loaded 1,000,000 entries in {elapsed:.2f}s")
+    print("root.get_size", root.get_size())
+    print("folder999/file999:", root.resolve("root/folder999/file999"))
+
+    scanned = load_directory(os.path.dirname(os.path.abspath(__file__)))
+    print("Scanned directory:", scanned, "size:", scanned.get_size())
+    print("Python modules:", scanned.search_glob("*.py"))
@@ -0,0 +1,217 @@
+"""
+Recomputing sizes and searching huge trees runs on a single core.
+
+Split the work across a pool of processes instead: every worker maps the same
+snapshot file (see composite_snapshot) so the tree is shared through the page
+cache, walks its share of the root's subtrees and sends back a partial sum or
+a list of matches. The parent process merges the partial results.
+"""
+
+import concurrent.futures
+import os
+import sys
+import tempfile
+import time
+import typing as t
+
+from composite_snapshot import (
+    FILE,
+    FOLDER,
+    HEADER,
+    MAGIC,
+    NO_NODE,
+    RECORD,
+    VERSION,
+    Snapshot,
+    SnapshotItem,
+)
+
+# Every worker process opens the snapshot once, in the pool initializer
+_worker_snapshot: t.Optional[Snapshot] = None
+
+
+def _open_worker_snapshot(path: str) -> None:
+    global _worker_snapshot
+    _worker_snapshot = Snapshot(path)
+
+
+def _aggregate(
+    first_id: int, last_id: int, name: t.Optional[bytes]
+) -> t.Tuple[int, t.List[int]]:
+    """Sum the file sizes and collect the ids of the items called `name` in the
+    subtrees rooted at the nodes first_id..last_id.
+    """
+    snapshot = _worker_snapshot
+    buffer = snapshot.buffer
+    strings_offset = snapshot.strings_offset
+    unpack_from = RECORD.unpack_from
+    header_size = HEADER.size
+    record_size = RECORD.size
+
+    size = 0
+    matches = []
+    ranges = [(first_id, last_id)]
+    while ranges:
+        first, last = ranges.pop()
+        for node_id in range(first, last):
+            record = unpack_from(buffer, header_size + node_id * record_size)
+            if record[7] == FILE:
+                size += record[0]
+            elif record[4]:
+                ranges.append((record[3], record[3] + record[4]))
+
+            if name is not None and record[6] == len(name):
+                start = strings_offset + record[5]
+                if buffer[start : start + record[6]] == name:
+                    matches.append(node_id)
+
+    return size, matches
+
+
+class ParallelAggregator:
+    """Runs get_size and search over a snapshot with a pool of worker processes."""
+
+    def __init__(self, snapshot_path: str, workers: t.Optional[int] = None):
+        self.snapshot = Snapshot(snapshot_path)
+        self.workers = workers or os.cpu_count()
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers,
+            initializer=_open_worker_snapshot,
+            initargs=(snapshot_path,),
+        )
+
+    def __enter__(self) -> "ParallelAggregator":
+        return self
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        self.snapshot.close()
+
+    def get_size(self) -> int:
+        size, _ = self._run(None)
+        return size
+
+    def search(self, name: str) -> t.List[SnapshotItem]:
+        _, matches = self._run(name.encode())
+        root = self.snapshot.root
+        if root.name == name:
+            matches.insert(0, root.node_id)
+
+        return [self.snapshot.node(node_id) for node_id in matches]
+
+    def _run(self, name: t.Optional[bytes]) -> t.Tuple[int, t.List[int]]:
+        # The children of the root are contiguous, split them into more chunks
+        # than workers so that uneven subtrees still balance out
+        record = self.snapshot.record(0)
+        first, count = record[3], record[4]
+        chunk_size = max(1, -(-count // (self.workers * 4)))
+        futures = [
+            self._pool.submit(
+                _aggregate, start, min(start + chunk_size, first + count), name
+            )
+            for start in range(first, first + count, chunk_size)
+        ]
+
+        size = 0
+        matches = []
+        for future in futures:
+            partial_size, partial_matches = future.result()
+            size += partial_size
+            matches.extend(partial_matches)
+
+        return size, matches
+
+
+def write_synthetic_snapshot(path: str, folders: int, files_per_folder: int) -> int:
+    """Write a two-level snapshot directly, without building the tree in memory."""
+    names = {"root": 0}
+    strings = bytearray(b"root")
+    for number in range(max(folders, files_per_folder)):
+        for prefix in ("folder", "file"):
+            name = f"{prefix}{number}"
+            names[name] = len(strings)
+            strings += name.encode()
+
+    file_size = 1
+    node_count = 1 + folders + folders * files_per_folder
+    no_hash = bytes(16)
+    with open(path, "wb") as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, VERSION, node_count, 0))
+        root_size = folders * files_per_folder * file_size
+        snapshot.write(
+            RECORD.pack(root_size, no_hash, NO_NODE, 1, folders, 0, len("root"), FOLDER)
+        )
+        for folder_number in range(folders):
+            name = f"folder{folder_number}"
+            first_child = 1 + folders + folder_number * files_per_folder
+            snapshot.write(
+                RECORD.pack(
+                    files_per_folder * file_size,
+                    no_hash,
+                    0,
+                    first_child,
+                    files_per_folder,
+                    names[name],
+                    len(name),
+                    FOLDER,
+                )
+            )
+
+        for folder_number in range(folders):
+            parent_id = 1 + folder_number
+            snapshot.write(
+                b"".join(
+                    RECORD.pack(
+                        file_size,
+                        no_hash,
+                        parent_id,
+                        NO_NODE,
+                        0,
+                        names[f"file{file_number}"],
+                        len(f"file{file_number}"),
+                        FILE,
+                    )
+                    for file_number in range(files_per_folder)
+                )
+            )
+
+        strings_offset = snapshot.tell()
+        snapshot.write(strings)
+        snapshot.seek(0)
+        snapshot.write(HEADER.pack(MAGIC, VERSION, node_count, strings_offset))
+
+    return node_count
+
+
+def benchmark(nodes: int) -> None:
+    folders = max(1, int(nodes**0.5))
+    files_per_folder = max(1, nodes // folders)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.snapshot")
+        node_count = write_synthetic_snapshot(path, folders, files_per_folder)
+        print(f"Synthetic snapshot with {node_count} nodes")
+
+        baseline = None
+        for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            with ParallelAggregator(path, workers) as aggregator:
+                # Warm up: start the worker processes and map the snapshot
+                aggregator.get_size()
+                start = time.perf_counter()
+                size = aggregator.get_size()
+                matches = aggregator.search("file7")
+                elapsed = time.perf_counter() - start
+
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>3} workers: {elapsed:.2f}s (x{baseline / elapsed:.1f}), "
+                f"size={size}, matches for file7={len(matches)}"
+            )
+
+
+if __name__ == "__main__":
+    # Pass 10000000 to reproduce the 10M-node benchmark
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
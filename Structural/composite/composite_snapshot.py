@@ -0,0 +1,280 @@
+"""
+Rebuilding the storage tree every time the service starts takes minutes for large
+customers. Save the tree to a compact binary snapshot instead and open it in
+place through mmap.
+
+The snapshot holds:
+- a header with the number of nodes and the offset of the string table
+- one fixed-width record per node, in breadth-first order so the children of a
+  folder are contiguous, sorted by name so a child is found by binary search
+- a string table with every distinct name stored once
+
+Opening a snapshot parses nothing up front: nodes are only decoded when accessed.
+"""
+
+import collections
+import mmap
+import os
+import struct
+import tempfile
+import time
+import typing as t
+
+from composite_with_path import File, Folder, Item
+
+MAGIC = b"CSNP"
+VERSION = 2
+HEADER = struct.Struct("<4sIQQ")  # magic, version, node count, string table offset
+# size, hash, parent id, first child id, child count, name offset, name length, kind
+RECORD = struct.Struct("<q16siiIQIB")
+NO_NODE = -1
+FILE = 0
+FOLDER = 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def save_snapshot(root: Folder, path: str) -> int:
+    """Write the tree under root to path and return the number of nodes written."""
+    name_offsets: t.Dict[str, int] = {}
+    strings = bytearray()
+
+    with open(path, "wb") as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+
+        # Node ids are assigned in breadth-first order, so the children of a node
+        # get the next free ids at the moment the node itself is written
+        queue = collections.deque([(root, NO_NODE)])
+        node_id = 0
+        next_id = 1
+        while queue:
+            item, parent_id = queue.popleft()
+            children = sorted(item.iter_children(), key=lambda child: child.name)
+            queue.extend((child, node_id) for child in children)
+
+            name_offset = name_offsets.get(item.name)
+            encoded_name = item.name.encode()
+            if name_offset is None:
+                name_offset = name_offsets[item.name] = len(strings)
+                strings += encoded_name
+
+            snapshot.write(
+                RECORD.pack(
+                    item.get_size(),
+                    item.get_hash().to_bytes(16, "big"),
+                    parent_id,
+                    next_id if children else NO_NODE,
+                    len(children),
+                    name_offset,
+                    len(encoded_name),
+                    FILE if isinstance(item, File) else FOLDER,
+                )
+            )
+            node_id += 1
+            next_id += len(children)
+
+        strings_offset = snapshot.tell()
+        snapshot.write(strings)
+        snapshot.seek(0)
+        snapshot.write(HEADER.pack(MAGIC, VERSION, node_id, strings_offset))
+
+    return node_id
+
+
+class Snapshot:
+    """A memory mapped snapshot. Use it as a context manager to unmap the file.
+
+    buffer is the mapped file and strings_offset the start of its string table,
+    for the readers that decode records in bulk (see composite_parallel).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as snapshot:
+            self.buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.node_count, self.strings_offset = HEADER.unpack_from(
+            self.buffer
+        )
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise SnapshotError(f"{path} is not a version {VERSION} snapshot")
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.buffer.close()
+
+    @property
+    def root(self) -> "SnapshotFolder":
+        return self.node(0)
+
+    def record(self, node_id: int) -> t.Tuple:
+        return RECORD.unpack_from(self.buffer, HEADER.size + node_id * RECORD.size)
+
+    def name(self, offset: int, length: int) -> str:
+        start = self.strings_offset + offset
+        return self.buffer[start : start + length].decode()
+
+    def node(self, node_id: int) -> "SnapshotItem":
+        record = self.record(node_id)
+        if record[7] == FOLDER:
+            return SnapshotFolder(self, node_id, record)
+
+        return SnapshotFile(self, node_id, record)
+
+
+class SnapshotItem(Item):
+    """A read-only view over one decoded snapshot record."""
+
+    __slots__ = ("snapshot", "node_id", "_record")
+
+    def __init__(self, snapshot: Snapshot, node_id: int, record: t.Tuple):
+        self.snapshot = snapshot
+        self.node_id = node_id
+        self._record = record
+
+    @property
+    def name(self) -> str:
+        return self.snapshot.name(self._record[5], self._record[6])
+
+    @property
+    def parent(self) -> t.Optional["SnapshotFolder"]:
+        parent_id = self._record[2]
+        if parent_id == NO_NODE:
+            return None
+
+        return self.snapshot.node(parent_id)
+
+    def get_size(self) -> int:
+        return self._record[0]
+
+    def get_hash(self) -> int:
+        return int.from_bytes(self._record[1], "big")
+
+    def search(self, name: str) -> t.List[Item]:
+        return list(self.iter_search(name))
+
+    def get_path(self) -> str:
+        names = [self.name]
+        parent_id = self._record[2]
+        while parent_id != NO_NODE:
+            record = self.snapshot.record(parent_id)
+            names.append(self.snapshot.name(record[5], record[6]))
+            parent_id = record[2]
+
+        return os.path.join(*reversed(names))
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, SnapshotItem)
+            and self.snapshot is other.snapshot
+            and self.node_id == other.node_id
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.snapshot), self.node_id))
+
+
+class SnapshotFile(SnapshotItem):
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return f"File({self.name})"
+
+
+class SnapshotFolder(SnapshotItem):
+    __slots__ = ()
+
+    def iter_children(self) -> t.Iterator[SnapshotItem]:
+        first_child, child_count = self._record[3], self._record[4]
+        for node_id in range(first_child, first_child + child_count):
+            yield self.snapshot.node(node_id)
+
+    def list_content(self) -> t.List[Item]:
+        return list(self.iter_children())
+
+    def get_child(self, name: str) -> t.Optional[SnapshotItem]:
+        """Binary search the children, which are stored sorted by name."""
+        snapshot = self.snapshot
+        low, high = self._record[3], self._record[3] + self._record[4]
+        while low < high:
+            middle = (low + high) // 2
+            record = snapshot.record(middle)
+            child_name = snapshot.name(record[5], record[6])
+            if child_name == name:
+                return snapshot.node(middle)
+
+            if child_name < name:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def resolve(self, path: str) -> t.Optional[SnapshotItem]:
+        """Find an item from its full path, decoding only the folders on the way."""
+        root_name, *names = os.path.normpath(path).split(os.sep)
+        if root_name != self.name:
+            return None
+
+        item = self
+        for name in names:
+            if not isinstance(item, SnapshotFolder):
+                return None
+
+            item = item.get_child(name)
+            if item is None:
+                return None
+
+        return item
+
+    def __repr__(self) -> str:
+        return f"Folder({self.name})"
+
+
+def open_snapshot(path: str) -> Snapshot:
+    return Snapshot(path)
+
+
+if __name__ == "__main__":
+    from composite_loader import TreeLoader
+
+    loader = TreeLoader()
+    for folder_number in range(500):
+        for file_number in range(200):
+            loader.add_entry(
+                f"folder{folder_number}/file{file_number}", size=file_number
+            )
+    root = loader.finish()
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "tree.snapshot")
+        start = time.perf_counter()
+        nodes = save_snapshot(root, snapshot_path)
+        print(f"Saved {nodes} nodes in {time.perf_counter() - start:.2f}s")
+        print(f"Snapshot size: {os.path.getsize(snapshot_path) / nodes:.1f} bytes/node")
+
+        start = time.perf_counter()
+        with open_snapshot(snapshot_path) as snapshot:
+            snapshot_root = snapshot.root
+            size = snapshot_root.get_size()
+            file = snapshot_root.resolve("root/folder499/file199")
+            elapsed = time.perf_counter() - start
+
+            print(f"Opened, sized and resolved a path in {elapsed * 1000:.2f}ms")
+            print("root.get_size", size, "== in memory:", root.get_size())
+            print("Resolved:", file, file.get_path(), file.get_size())
+            print(
+                "Same hash as in memory:", snapshot_root.get_hash() == root.get_hash()
+            )
+            print(
+                "folder7 content:",
+                snapshot_root.get_child("folder7").list_content()[:3],
+            )
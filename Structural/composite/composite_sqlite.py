@@ -0,0 +1,306 @@
+"""
+The service restarts often and reloading every customer's tree into Folder objects
+just to answer a few questions is wasteful.
+
+Persist the Item hierarchy in SQLite with a closure table instead: besides the
+items themselves, one row is stored for every (ancestor, descendant) pair. With it:
+- the size of a folder is a single SUM over its descendants
+- searching a subtree is a single indexed join
+- moving a subtree is a fixed number of set-based statements in one transaction
+"""
+
+import contextlib
+import os
+import sqlite3
+import time
+import typing as t
+
+from composite_with_path import Folder, InvalidMoveError, Item, ItemExistsError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    parent_id INTEGER REFERENCES items (id),
+    name TEXT NOT NULL,
+    is_folder INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_name ON items (name);
+CREATE INDEX IF NOT EXISTS items_parent ON items (parent_id);
+
+CREATE TABLE IF NOT EXISTS closure (
+    ancestor INTEGER NOT NULL REFERENCES items (id),
+    descendant INTEGER NOT NULL REFERENCES items (id),
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor, descendant)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS closure_descendant ON closure (descendant, depth);
+"""
+
+
+class SQLiteItemStore:
+    def __init__(self, database: str = ":memory:"):
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+
+    def save(self, root: Item) -> "StoredItem":
+        """Store the tree under root and return a view of the stored root."""
+        cursor = self.connection.cursor()
+        with self.connection:
+            # Every stack entry carries the ids of its ancestors, nearest last
+            stack = [(root, None, [])]
+            root_id = None
+            while stack:
+                item, parent_id, ancestors = stack.pop()
+                is_folder = isinstance(item, Folder)
+                cursor.execute(
+                    "INSERT INTO items (parent_id, name, is_folder, size) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        parent_id,
+                        item.name,
+                        is_folder,
+                        0 if is_folder else item.get_size(),
+                    ),
+                )
+                item_id = cursor.lastrowid
+                root_id = root_id or item_id
+
+                lineage = ancestors + [item_id]
+                cursor.executemany(
+                    "INSERT INTO closure VALUES (?, ?, ?)",
+                    (
+                        (ancestor, item_id, len(lineage) - 1 - depth)
+                        for depth, ancestor in enumerate(lineage)
+                    ),
+                )
+                stack.extend(
+                    (child, item_id, lineage)
+                    for child in reversed(list(item.iter_children()))
+                )
+
+        return self.get(root_id)
+
+    def get(self, item_id: int) -> t.Optional["StoredItem"]:
+        row = self.connection.execute(
+            "SELECT name, is_folder FROM items WHERE id = ?", (item_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        name, is_folder = row
+        view = StoredFolder if is_folder else StoredFile
+        return view(self, item_id, name)
+
+    def get_size(self, item_id: int) -> int:
+        (size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(items.size), 0) FROM closure "
+            "JOIN items ON items.id = closure.descendant "
+            "WHERE closure.ancestor = ?",
+            (item_id,),
+        ).fetchone()
+        return size
+
+    def search(self, item_id: int, name: str) -> t.List["StoredItem"]:
+        rows = self.connection.execute(
+            # CROSS JOIN makes SQLite start from the name index, then check the
+            # closure primary key, so the cost follows the number of matches
+            "SELECT items.id, items.name, items.is_folder FROM items "
+            "CROSS JOIN closure ON closure.descendant = items.id "
+            "WHERE items.name = ? AND closure.ancestor = ?",
+            (name, item_id),
+        )
+        return [self._view(*row) for row in rows]
+
+    def descendants(
+        self, item_id: int, max_depth: t.Optional[int] = None
+    ) -> t.List["StoredItem"]:
+        rows = self.connection.execute(
+            "SELECT items.id, items.name, items.is_folder FROM closure "
+            "JOIN items ON items.id = closure.descendant "
+            "WHERE closure.ancestor = ? AND closure.depth >= 1 "
+            "AND (? IS NULL OR closure.depth <= ?) "
+            "ORDER BY closure.depth",
+            (item_id, max_depth, max_depth),
+        )
+
+        return [self._view(*row) for row in rows]
+
+    def children(self, item_id: int) -> t.List["StoredItem"]:
+        rows = self.connection.execute(
+            "SELECT id, name, is_folder FROM items WHERE parent_id = ?", (item_id,)
+        )
+        return [self._view(*row) for row in rows]
+
+    def get_path(self, item_id: int) -> str:
+        rows = self.connection.execute(
+            "SELECT items.name FROM closure "
+            "JOIN items ON items.id = closure.ancestor "
+            "WHERE closure.descendant = ? ORDER BY closure.depth DESC",
+            (item_id,),
+        )
+        return os.path.join(*(name for name, in rows))
+
+    def move(self, item_id: int, new_parent_id: int) -> None:
+        """Move the subtree rooted at item_id under new_parent_id."""
+        with self.connection:
+            target = self.connection.execute(
+                "SELECT is_folder FROM items WHERE id = ?", (new_parent_id,)
+            ).fetchone()
+            if not target or not target[0]:
+                raise InvalidMoveError("Items can only be moved into a folder")
+
+            (name,) = self.connection.execute(
+                "SELECT name FROM items WHERE id = ?", (item_id,)
+            ).fetchone()
+            taken = self.connection.execute(
+                "SELECT 1 FROM items WHERE parent_id = ? AND name = ? AND id != ?",
+                (new_parent_id, name, item_id),
+            ).fetchone()
+            if taken:
+                raise ItemExistsError(
+                    f"The folder already contains an item named {name}"
+                )
+
+            inside = self.connection.execute(
+                "SELECT 1 FROM closure WHERE ancestor = ? AND descendant = ?",
+                (item_id, new_parent_id),
+            ).fetchone()
+            if inside:
+                raise InvalidMoveError("Cannot move a folder inside its own subtree")
+
+            # Drop the links between the subtree and its old ancestors...
+            self.connection.execute(
+                "DELETE FROM closure "
+                "WHERE descendant IN "
+                "(SELECT descendant FROM closure WHERE ancestor = ?) "
+                "AND ancestor NOT IN "
+                "(SELECT descendant FROM closure WHERE ancestor = ?)",
+                (item_id, item_id),
+            )
+            # ...and link every node of the subtree to the new ancestors
+            self.connection.execute(
+                "INSERT INTO closure (ancestor, descendant, depth) "
+                "SELECT above.ancestor, below.descendant, "
+                "above.depth + below.depth + 1 "
+                "FROM closure AS above CROSS JOIN closure AS below "
+                "WHERE above.descendant = ? AND below.ancestor = ?",
+                (new_parent_id, item_id),
+            )
+            self.connection.execute(
+                "UPDATE items SET parent_id = ? WHERE id = ?", (new_parent_id, item_id)
+            )
+
+    def _view(self, item_id: int, name: str, is_folder: int) -> "StoredItem":
+        view = StoredFolder if is_folder else StoredFile
+        return view(self, item_id, name)
+
+
+class StoredItem(Item):
+    """A view over one stored item. Every call is answered by the database."""
+
+    __slots__ = ("store", "item_id", "name")
+
+    def __init__(self, store: SQLiteItemStore, item_id: int, name: str):
+        self.store = store
+        self.item_id = item_id
+        self.name = name
+
+    def get_size(self) -> int:
+        return self.store.get_size(self.item_id)
+
+    def search(self, name: str) -> t.List[Item]:
+        return self.store.search(self.item_id, name)
+
+    def get_path(self) -> str:
+        return self.store.get_path(self.item_id)
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, StoredItem)
+            and self.store is other.store
+            and self.item_id == other.item_id
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.store), self.item_id))
+
+
+class StoredFile(StoredItem):
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return f"File({self.name})"
+
+
+class StoredFolder(StoredItem):
+    __slots__ = ()
+
+    def iter_children(self) -> t.List[Item]:
+        return self.store.children(self.item_id)
+
+    def list_content(self) -> t.List[Item]:
+        return self.store.children(self.item_id)
+
+    def descendants(self, max_depth: t.Optional[int] = None) -> t.List[Item]:
+        return self.store.descendants(self.item_id, max_depth)
+
+    def move_to(self, folder: "StoredFolder") -> None:
+        self.store.move(self.item_id, folder.item_id)
+
+    def __repr__(self) -> str:
+        return f"Folder({self.name})"
+
+
+def benchmark(folders: int = 200, files_per_folder: int = 200) -> None:
+    """Compare the SQL queries with the recursive in-memory composite_easy tree."""
+    import composite_easy
+    from composite_loader import TreeLoader
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        easy_root = composite_easy.Folder("root")
+        for folder_number in range(folders):
+            folder = composite_easy.Folder(f"folder{folder_number}")
+            easy_root.add(folder)
+            for file_number in range(files_per_folder):
+                folder.add(composite_easy.File(f"file{file_number}", size=1))
+
+    loader = TreeLoader()
+    for folder_number in range(folders):
+        for file_number in range(files_per_folder):
+            loader.add_entry(f"folder{folder_number}/file{file_number}", size=1)
+
+    store = SQLiteItemStore()
+    stored_root = store.save(loader.finish())
+
+    for label, operation in (
+        ("recursive get_size", easy_root.get_size),
+        ("SQL get_size", stored_root.get_size),
+        ("recursive search", lambda: easy_root.search("file7")),
+        ("SQL search", lambda: stored_root.search("file7")),
+    ):
+        start = time.perf_counter()
+        for _ in range(10):
+            operation()
+        elapsed = (time.perf_counter() - start) / 10
+        print(f"{label:>20}: {elapsed * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    from composite_with_path import load_structure
+
+    store = SQLiteItemStore()
+    root = store.save(load_structure())
+
+    print("root.get_size", root.get_size())
+    print("root content:", root.list_content())
+    file22 = root.search("file22")[0]
+    print("file22 path:", file22.get_path())
+
+    folder1, folder21 = root.search("folder1")[0], root.search("folder21")[0]
+    folder21.move_to(folder1)
+    print("file22 path after moving folder21:", file22.get_path())
+    print("Size of folder1:", folder1.get_size())
+    print("Descendants of folder1:", folder1.descendants())
+
+    benchmark()
@@ -6,14 +6,50 @@ Build the structure for the storage system that can do the following:
 - Get the size of each folder and file
 - Search for a file or folder by name
 - Get the path of an item
+
+Folder sizes are cached and kept up to date along the parent chain, so reading
+the size of any folder is O(1) and every change costs O(depth).
+
+The root folder of every tree owns a name index and a path index that are kept up
+to date by add, remove and renames, so searching costs the number of matches and
+resolving a path is a single dict lookup. Paths are memoized on every item.
+Children are keyed by name, so adding, removing and looking up a child is O(1).
+
+Every folder also keeps a Merkle-style content hash, maintained together with its
+size, so two trees can be diffed by only descending into subtrees that differ.
 """
 
 import abc
+import bisect
+import collections
+import contextlib
+import fnmatch
+import hashlib
+import heapq
+import itertools
 import os
+import time
 import typing as t
 
+HASH_MODULUS = 2**128
+
+
+class ItemExistsError(Exception):
+    pass
+
+
+class InvalidMoveError(Exception):
+    pass
+
+
+class Change(t.NamedTuple):
+    kind: str  # "added", "removed" or "modified"
+    path: str
+
 
 class Item(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
     def get_size(self) -> int:
         pass
@@ -26,21 +62,250 @@ class Item(abc.ABC):
     def get_path(self) -> str:
         pass
 
+    def iter_children(self) -> t.Iterable["Item"]:
+        return ()
+
+    def walk(
+        self, breadth_first: bool = False, max_depth: t.Optional[int] = None
+    ) -> t.Iterator["Item"]:
+        """Lazily yield this item and its descendants without recursion.
+
+        The item itself is at depth 0; items deeper than max_depth are not visited.
+        """
+        if breadth_first:
+            queue = collections.deque([(0, self)])
+            while queue:
+                depth, item = queue.popleft()
+                yield item
+                if max_depth is None or depth < max_depth:
+                    queue.extend((depth + 1, child) for child in item.iter_children())
+            return
+
+        # A stack of iterators keeps the first results cheap even for wide folders
+        stack = [(0, iter((self,)))]
+        while stack:
+            depth, items = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                continue
+
+            yield item
+            if max_depth is None or depth < max_depth:
+                stack.append((depth + 1, iter(item.iter_children())))
+
+    def iter_search(
+        self, name: str, breadth_first: bool = False, max_depth: t.Optional[int] = None
+    ) -> t.Iterator["Item"]:
+        return (
+            item for item in self.walk(breadth_first, max_depth) if item.name == name
+        )
+
+
+class NameIndex:
+    """Maps names to the items of a tree.
+
+    Exact lookups go through a dict. Prefix and glob lookups go through a list of
+    names that is kept sorted on every change, so a query only costs its matches.
+    """
+
+    def __init__(self):
+        self._items: t.Dict[str, t.Dict[Item, None]] = {}
+        self._names: t.List[str] = []
+        # Names still in the sorted list although no item has them any more
+        self._stale = 0
+
+    def add(self, item: Item) -> None:
+        items = self._items.get(item.name)
+        if items is None:
+            items = self._items[item.name] = {}
+            self._insert_names([item.name])
+
+        items[item] = None
+
+    def add_many(self, items: t.Iterable[Item]) -> None:
+        new_names = []
+        for item in items:
+            entries = self._items.get(item.name)
+            if entries is None:
+                entries = self._items[item.name] = {}
+                new_names.append(item.name)
+
+            entries[item] = None
+
+        self._insert_names(new_names)
+
+    def discard(self, item: Item) -> None:
+        items = self._items.get(item.name)
+        if items is None:
+            return
+
+        items.pop(item, None)
+        if not items:
+            # The name stays in the sorted list, queries skip it
+            del self._items[item.name]
+            self._stale += 1
+            if self._stale > len(self._names) // 2:
+                self._names = [name for name in self._names if name in self._items]
+                self._stale = 0
+
+    def update(self, other: "NameIndex") -> None:
+        new_names = []
+        for name, items in other._items.items():
+            if name not in self._items:
+                self._items[name] = {}
+                new_names.append(name)
+
+            self._items[name].update(items)
+
+        self._insert_names(new_names)
+
+    def _insert_names(self, new_names: t.List[str]) -> None:
+        names = self._names
+        if len(new_names) < 64:
+            for name in new_names:
+                position = bisect.bisect_left(names, name)
+                if position < len(names) and names[position] == name:
+                    self._stale -= 1
+                else:
+                    names.insert(position, name)
+            return
+
+        # Large batches are merged in a single pass instead of one insert each
+        merged = [
+            name for name, _ in itertools.groupby(heapq.merge(names, sorted(new_names)))
+        ]
+        self._stale -= len(names) + len(new_names) - len(merged)
+        self._names = merged
+
+    def exact(self, name: str) -> t.Iterator[Item]:
+        return iter(self._items.get(name, ()))
+
+    def prefix(self, prefix: str) -> t.Iterator[Item]:
+        for name in self._names_with_prefix(prefix):
+            yield from self._items[name]
+
+    def glob(self, pattern: str) -> t.Iterator[Item]:
+        wildcard = min(
+            (pattern.find(char) for char in "*?[" if char in pattern),
+            default=len(pattern),
+        )
+        if wildcard == len(pattern):
+            yield from self.exact(pattern)
+            return
+
+        for name in self._names_with_prefix(pattern[:wildcard]):
+            if fnmatch.fnmatchcase(name, pattern):
+                yield from self._items[name]
+
+    def _names_with_prefix(self, prefix: str) -> t.Iterator[str]:
+        names = self._names
+        start = bisect.bisect_left(names, prefix)
+        for position in range(start, len(names)):
+            name = names[position]
+            if not name.startswith(prefix):
+                break
+
+            if name in self._items:
+                yield name
+
+
+def _digest(*parts: t.Any) -> int:
+    data = "\0".join(str(part) for part in parts).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=16).digest(), "big")
+
+
+def _fill_paths(item: Item) -> None:
+    """Cache the paths from the closest ancestor with a known path down to the item."""
+    missing = []
+    while item is not None and item._path is None:
+        missing.append(item)
+        item = item.parent
+
+    path = item._path if item is not None else None
+    for item in reversed(missing):
+        path = item.name if path is None else os.path.join(path, item.name)
+        item._path = path
+
+
+def _rename(item: Item, name: str) -> None:
+    """Rename an item and refresh the indexes of the tree it belongs to."""
+    if name == item.name:
+        return
+
+    if item.parent and name in item.parent.children:
+        raise ItemExistsError(f"{item.parent} already contains an item named {name}")
+
+    root = item.parent.get_root() if item.parent else item
+    if not isinstance(root, Folder):
+        item._name = name
+        item._path = None
+        return
+
+    subtree = list(item.walk())
+    for descendant in subtree:
+        root._paths.pop(descendant.get_path(), None)
+        descendant._path = None
+
+    root._index.discard(item)
+    if item.parent:
+        # The renamed item moves to the end of its folder's listing
+        item.parent.children[name] = item.parent.children.pop(item.name)
+
+    old_hash = item.get_hash()
+    item._name = name
+    root._index.add(item)
+    if isinstance(item, Folder):
+        item._hash = _digest("folder", name, item._content_hash)
+
+    if item.parent:
+        item.parent._propagate(0, old_hash, item.get_hash())
+
+    for descendant in subtree:
+        root._paths[descendant.get_path()] = descendant
+
 
 class File(Item):
     def __init__(self, name: str, size: int, parent: Item = None):
-        self.name = name
-        self.size = size
+        self._name = name
+        self._size = size
+        self._path = None
         self.parent = parent
 
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str) -> None:
+        _rename(self, value)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @size.setter
+    def size(self, value: int) -> None:
+        delta = value - self._size
+        old_hash = self.get_hash()
+        self._size = value
+        if self.parent:
+            self.parent._propagate(delta, old_hash, self.get_hash())
+
     def get_size(self) -> int:
-        return self.size
+        return self._size
+
+    def get_hash(self) -> int:
+        return _digest("file", self._name, self._size)
 
     def search(self, name: str) -> t.List[Item]:
         return [self] if self.name == name else []
 
     def get_path(self) -> str:
-        return os.path.join(self.parent.get_path(), self.name)
+        if self._path is None:
+            _fill_paths(self)
+
+        return self._path
 
     def __repr__(self) -> str:
         return f"File({self.name})"
@@ -48,43 +313,326 @@ class File(Item):
 
 class Folder(Item):
     def __init__(self, name: str, parent: Item = None):
-        self.name = name
+        self._name = name
+        self._path = None
         self.parent = parent
-        self.children = []
+        self.children: t.Dict[str, Item] = {}
+        self._size = 0
+        # Order independent sum of the children hashes, so updates are O(1) per level
+        self._content_hash = 0
+        self._hash = _digest("folder", name, 0)
+        # Only the root of a tree owns the indexes
+        self._index = NameIndex()
+        self._index.add(self)
+        self._paths = {name: self}
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str) -> None:
+        _rename(self, value)
 
     def add(self, item: Item) -> None:
         print(f"Creating item {item}...")
-        item.parent = self
-        self.children.append(item)
+        self._attach(item)
 
     def remove(self, item: Item) -> None:
-        for component in self.children:
-            if component.name == item.name:
-                print(f"Removing the item {item}...")
-                component.parent = None
-                self.children.remove(component)
+        # Another item with the same name is not the one to remove
+        if self.children.get(item.name) is item:
+            print(f"Removing the item {item}...")
+            self._detach(item)
+
+    def add_many(self, items: t.Iterable[Item]) -> None:
+        """Add a batch of new items with a single size update and no logging."""
+        self._attach_many(list(items))
+
+    def remove_many(self, items: t.Iterable[Item]) -> None:
+        components = [item for item in items if self.children.get(item.name) is item]
+        print(f"Removing {len(components)} items from {self}...")
+        self._detach_many(components)
+
+    def get_child(self, name: str) -> t.Optional[Item]:
+        return self.children.get(name)
+
+    def _attach(self, item: Item) -> None:
+        if self.children.get(item.name) is item:
+            return
+
+        if item.name in self.children:
+            raise ItemExistsError(f"{self} already contains an item named {item.name}")
+
+        self._check_move(item)
+        if item.parent and item.parent.children.get(item.name) is item:
+            # Moving an item detaches it from its current folder first
+            item.parent._detach(item)
+
+        item.parent = self
+        self.children[item.name] = item
+        self._propagate(item.get_size(), 0, item.get_hash())
+
+        root = self.get_root()
+        if isinstance(item, Folder):
+            root._index.update(item._index)
+            item._index = None
+            item._paths = None
+        else:
+            root._index.add(item)
+
+        for descendant in item.walk():
+            descendant._path = None
+            root._paths[descendant.get_path()] = descendant
+
+    def _attach_many(self, items: t.List[Item]) -> None:
+        """Attach a batch of items with a single size update.
+
+        Items that belong to another folder are detached from it first, one batch
+        per folder, as _attach does for a single item.
+        """
+        children = dict.fromkeys(item.name for item in items)
+        if len(children) < len(items) or not children.keys().isdisjoint(self.children):
+            raise ItemExistsError(f"Duplicate names in the batch added to {self}")
+
+        moved: t.Dict[Folder, t.List[Item]] = {}
+        for item in items:
+            self._check_move(item)
+            if item.parent and item.parent.children.get(item.name) is item:
+                moved.setdefault(item.parent, []).append(item)
+
+        for parent, parent_items in moved.items():
+            parent._detach_many(parent_items)
+
+        root = self.get_root()
+        prefix = os.path.join(self.get_path(), "")
+        size = 0
+        content_hash = 0
+        for item in items:
+            item.parent = self
+            size += item.get_size()
+            content_hash += item.get_hash()
+            if isinstance(item, Folder):
+                root._index.update(item._index)
+                item._index = None
+                item._paths = None
+                for descendant in item.walk():
+                    descendant._path = None
+                    root._paths[descendant.get_path()] = descendant
+            else:
+                item._path = prefix + item.name
+                root._paths[item._path] = item
+
+        root._index.add_many(item for item in items if not isinstance(item, Folder))
+        self.children.update((item.name, item) for item in items)
+        self._propagate(size, 0, content_hash % HASH_MODULUS)
+
+    def _check_move(self, item: Item) -> None:
+        if isinstance(item, Folder) and item.contains(self):
+            raise InvalidMoveError(f"Cannot move {item} inside its own subtree")
+
+    def _detach(self, item: Item) -> None:
+        self._detach_many([item])
+
+    def _detach_many(self, items: t.List[Item]) -> None:
+        """Detach children of this folder with a single size update."""
+        root = self.get_root()
+        size = 0
+        content_hash = 0
+        for item in items:
+            subtree = list(item.walk())
+            for descendant in subtree:
+                root._index.discard(descendant)
+                root._paths.pop(descendant.get_path(), None)
+                descendant._path = None
+
+            item.parent = None
+            del self.children[item.name]
+            size += item.get_size()
+            content_hash += item.get_hash()
+
+            if isinstance(item, Folder):
+                # The detached folder becomes the root of its own tree
+                item._index = NameIndex()
+                item._index.add_many(subtree)
+                item._paths = {}
+                for descendant in subtree:
+                    item._paths[descendant.get_path()] = descendant
+
+        self._propagate(-size, content_hash % HASH_MODULUS, 0)
+
+    def get_root(self) -> "Folder":
+        folder = self
+        while folder.parent:
+            folder = folder.parent
+
+        return folder
+
+    def contains(self, item: Item) -> bool:
+        """Check whether the item is this folder or one of its descendants."""
+        while item:
+            if item is self:
+                return True
+
+            item = item.parent
+
+        return False
+
+    def resolve(self, path: str) -> t.Optional[Item]:
+        """Find the item with the given full path inside this folder."""
+        item = self.get_root()._paths.get(os.path.normpath(path))
+        if item is None or not self.contains(item):
+            return None
+
+        return item
 
     def list_content(self) -> t.List[Item]:
-        return self.children
+        return list(self.children.values())
+
+    def iter_children(self) -> t.Iterable[Item]:
+        return self.children.values()
 
     def get_size(self) -> int:
-        return sum(child.get_size() for child in self.children)
+        return self._size
+
+    def get_hash(self) -> int:
+        return self._hash
+
+    def _propagate(self, size_delta: int, old_hash: int, new_hash: int) -> None:
+        """Update the size and hash of this folder and its ancestors in one pass.
+
+        old_hash and new_hash are the contribution of the changed children to
+        this folder's content hash before and after the change.
+        """
+        folder = self
+        while folder:
+            folder._size += size_delta
+            if old_hash != new_hash:
+                folder._content_hash = (
+                    folder._content_hash - old_hash + new_hash
+                ) % HASH_MODULUS
+                old_hash = folder._hash
+                new_hash = folder._hash = _digest(
+                    "folder", folder._name, folder._content_hash
+                )
+
+            folder = folder.parent
+
+    def largest(
+        self,
+        k: int,
+        max_depth: t.Optional[int] = None,
+        item_type: t.Optional[t.Type[Item]] = None,
+    ) -> t.List[Item]:
+        """Return the k largest items under this folder, largest first.
+
+        A folder is never smaller than anything it contains, so a heap ordered by
+        the cached sizes only opens the folders that can still hold a top-k item.
+        The direct children are at depth 1; item_type keeps only Files or Folders.
+        """
+        counter = itertools.count()
+        heap = [
+            (-child.get_size(), next(counter), 1, child)
+            for child in self.iter_children()
+        ]
+        heapq.heapify(heap)
 
-    def search(self, name: str) -> t.List[Item]:
         results = []
-        if self.name == name:
-            results.append(self)
+        while heap and len(results) < k:
+            _, _, depth, item = heapq.heappop(heap)
+            if item_type is None or isinstance(item, item_type):
+                results.append(item)
 
-        for child in self.children:
-            results.extend(child.search(name))
+            if isinstance(item, Folder) and (max_depth is None or depth < max_depth):
+                for child in item.iter_children():
+                    heapq.heappush(
+                        heap, (-child.get_size(), next(counter), depth + 1, child)
+                    )
 
         return results
 
-    def get_path(self) -> str:
+    def diff(self, other: "Folder") -> t.List[Change]:
+        """List the changes that turn this folder's content into the other's.
+
+        Subtrees with the same hash are skipped, so the cost depends on the size
+        of the change rather than on the size of the trees.
+        """
+        changes = []
+        stack = [("", self, other)]
+        while stack:
+            path, folder, other_folder = stack.pop()
+            if folder._content_hash == other_folder._content_hash:
+                continue
+
+            for name, item in folder.children.items():
+                other_item = other_folder.children.get(name)
+                item_path = os.path.join(path, name)
+                if other_item is None:
+                    changes.append(Change("removed", item_path))
+                elif item.get_hash() == other_item.get_hash():
+                    continue
+                elif isinstance(item, Folder) and isinstance(other_item, Folder):
+                    stack.append((item_path, item, other_item))
+                else:
+                    changes.append(Change("modified", item_path))
+
+            for name in other_folder.children.keys() - folder.children.keys():
+                changes.append(Change("added", os.path.join(path, name)))
+
+        return changes
+
+    def check_consistency(self) -> t.List["Folder"]:
+        """Recompute every folder size and hash from scratch and compare with the cache.
+
+        Returns the folders whose cached values are wrong (empty if all is consistent).
+        """
+        folders = [item for item in self.walk() if isinstance(item, Folder)]
+        subfolder_sizes = dict.fromkeys(folders, 0)
+        subfolder_hashes = dict.fromkeys(folders, 0)
+        mismatches = []
+
+        # Subfolders come after their parent in a depth-first walk
+        for folder in reversed(folders):
+            files = [
+                child
+                for child in folder.children.values()
+                if not isinstance(child, Folder)
+            ]
+            size = subfolder_sizes[folder] + sum(file.get_size() for file in files)
+            content_hash = (
+                subfolder_hashes[folder] + sum(file.get_hash() for file in files)
+            ) % HASH_MODULUS
+            if size != folder._size or content_hash != folder._content_hash:
+                mismatches.append(folder)
+
+            if folder is not self:
+                subfolder_sizes[folder.parent] += size
+                subfolder_hashes[folder.parent] += _digest(
+                    "folder", folder._name, content_hash
+                )
+
+        return mismatches
+
+    def search(self, name: str) -> t.List[Item]:
+        return self._scoped(self.get_root()._index.exact(name))
+
+    def search_prefix(self, prefix: str) -> t.List[Item]:
+        return self._scoped(self.get_root()._index.prefix(prefix))
+
+    def search_glob(self, pattern: str) -> t.List[Item]:
+        return self._scoped(self.get_root()._index.glob(pattern))
+
+    def _scoped(self, items: t.Iterable[Item]) -> t.List[Item]:
+        """Keep only the indexed items that live in this folder's subtree."""
         if not self.parent:
-            return self.name
+            return list(items)
+
+        return [item for item in items if self.contains(item)]
+
+    def get_path(self) -> str:
+        if self._path is None:
+            _fill_paths(self)
 
-        return os.path.join(self.parent.get_path(), self.name)
+        return self._path
 
     def __repr__(self) -> str:
         return f"Folder({self.name})"
@@ -121,6 +669,37 @@ def load_structure():
     return root
 
 
+def benchmark_wide_folder(width: int) -> None:
+    """Time the child operations of a single folder holding `width` files."""
+    folder = Folder("wide")
+    files = [File(f"file{number}", size=1) for number in range(width)]
+
+    start = time.perf_counter()
+    folder.add_many(files)
+    added = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for file in files:
+        folder.get_child(file.name)
+    looked_up = time.perf_counter() - start
+
+    # remove and remove_many log what they do, that is part of their cost
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for file in files[: width // 2]:
+            folder.remove(file)
+        removed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        folder.remove_many(files[width // 2 :])
+        removed_many = time.perf_counter() - start
+
+    print(
+        f"width={width:>7}: add {added:.3f}s, lookup {looked_up:.3f}s, "
+        f"remove one by one {removed:.3f}s, remove_many {removed_many:.3f}s"
+    )
+
+
 if __name__ == "__main__":
     root = load_structure()
     print("root.get_size", root.get_size())
@@ -140,3 +719,34 @@ if __name__ == "__main__":
 
     file22 = root.search("file22")[0]
     print("file22 path:", file22.get_path())
+
+    print('Items starting with "file2":', root.search_prefix("file2"))
+    print(
+        'Items matching "folder*" in folder2:', folder21.parent.search_glob("folder*")
+    )
+
+    print("Resolved path:", root.resolve("root/folder2/folder21/file22"))
+    folder21.name = "folder22"
+    print("file22 path after renaming folder21:", file22.get_path())
+
+    print(
+        "First item named file21:", next(root.iter_search("file21", breadth_first=True))
+    )
+    print("Top two levels:", list(root.walk(max_depth=1)))
+
+    file22.size = 35
+    print("Size of root after resizing file22:", root.get_size())
+    print("Inconsistent folders:", root.check_consistency())
+
+    print("Three largest items:", root.largest(3))
+    print(
+        "Two largest files at depth <= 2:", root.largest(2, max_depth=2, item_type=File)
+    )
+
+    other_root = load_structure()
+    other_root.resolve("root/folder1/file11").size = 11
+    other_root.add(File("file03", size=60))
+    print("Changes between the two trees:", root.diff(other_root))
+
+    for width in (10_000, 100_000):
+        benchmark_wide_folder(width)